@@ -0,0 +1,490 @@
+""" An offline benchmark-harness for the views talking to openstack and ceph
+
+This module contains a small stub-server which answers the requests cloudadmin
+sends to keystone, nova, cinder, neutron and the ceph rgw's with responses
+shaped like the ones recorded from the real services. The responses are
+generated from a synthetic dataset of a configurable size, and every response
+can be delayed to simulate the latency of the real API's. The stub counts the
+calls it receives per service.
+
+The benchmark drives the most important views and methods against the stub,
+and reports the latency, the number of backend-calls and the number of
+database-queries of each. The numbers are mostly useful when compared between
+two versions of cloudadmin, to catch changes in how many calls a view fans out
+to before they are deployed.
+"""
+
+import json
+import re
+import statistics
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from cloudadmin.endpoints import openstack as endpoints
+from cloudadmin.ldap import custom_sync_user_relations
+from cloudadmin.models import LDAPSyncState, Project, Quota, Usage
+from cloudadmin.openstack import getOpenstackConnection, getOpenstackProject
+from cloudadmin.settings import LDAP_AUTH_MEMBER_OF_ATTRIBUTE, parser
+
+def hexid():
+  """ Returns a random ID in the format used by keystone """
+
+  return uuid.uuid4().hex
+
+def buildFixtures(projects, members):
+  """ Creates a synthetic dataset for the stub-server
+
+  The dataset contains the supplied number of openstack projects, and the
+  supplied number of users having roles in each of them. Every tenth member
+  is a group rather than a user. All projects are managed by the same
+  cloudadmin project.
+  """
+
+  fixtures = {
+    'domain': {'id': 'default', 'name': 'Default', 'enabled': True,
+        'description': ''},
+    'roles': {},
+    'projects': {},
+    'users': {},
+    'groups': {},
+  }
+
+  for name in ['_member_', 'heat_stack_owner', 'cloudadmin', 'admin']:
+    role_id = hexid()
+    fixtures['roles'][role_id] = {'id': role_id, 'name': name,
+        'domain_id': None}
+
+  for i in range(projects):
+    project_id = hexid()
+    fixtures['projects'][project_id] = {
+      'id': project_id,
+      'name': 'BENCH_project%04d' % i,
+      'description': 'Benchmark project %d' % i,
+      'domain_id': 'default',
+      'enabled': True,
+      'is_domain': False,
+      'parent_id': 'default',
+      'tags': ['CloudAdminProject=1', 'Expire=2099-01-01'],
+    }
+
+  for i in range(members):
+    principal_id = hexid()
+    if(i % 10 == 9):
+      fixtures['groups'][principal_id] = {'id': principal_id,
+          'name': 'group%04d' % i, 'domain_id': 'default', 'description': ''}
+    else:
+      fixtures['users'][principal_id] = {'id': principal_id,
+          'name': 'user%04d' % i, 'domain_id': 'default', 'enabled': True,
+          'email': 'user%04d@example.com' % i}
+
+  return fixtures
+
+class StubServer(ThreadingHTTPServer):
+  """ A HTTP server answering like keystone, nova, cinder, neutron and rgw
+
+  Each service is available under its own path-prefix (/identity, /compute,
+  /volume, /network and /admin for the rgw's). Every request is delayed by the
+  configured latency (in seconds) before it is answered.
+  """
+
+  daemon_threads = True
+
+  def __init__(self, fixtures, latency = 0, address = ('127.0.0.1', 0)):
+    super().__init__(address, StubRequestHandler)
+    self.fixtures = fixtures
+    self.latency = latency
+    self.calls = {}
+    self.lock = threading.Lock()
+    self.url = 'http://%s:%d' % self.server_address
+    self.admin_project = hexid()
+    self.roles = {r['name']: r['id'] for r in fixtures['roles'].values()}
+    self.routes = [
+      ('GET', r'^/identity(/v3)?/?$', 'keystone', self.identityVersion),
+      ('POST', r'^/identity/v3/auth/tokens$', 'keystone', self.token),
+      ('GET', r'^/identity/v3/(projects|roles|users|groups|domains)$',
+          'keystone', self.identityList),
+      ('GET', r'^/identity/v3/(projects|roles|users|groups|domains)/([^/]+)$',
+          'keystone', self.identityGet),
+      ('GET', r'^/identity/v3/role_assignments$', 'keystone',
+          self.roleAssignments),
+      ('PUT', r'^/identity/v3/projects/[^/]+/(users|groups)/[^/]+/roles/' +
+          r'[^/]+$', 'keystone', self.noContent),
+      ('DELETE', r'^/identity/v3/projects/[^/]+/(users|groups)/[^/]+/roles/' +
+          r'[^/]+$', 'keystone', self.noContent),
+      ('GET', r'^/compute(/v2\.1)?/?$', 'nova', self.computeVersion),
+      ('GET', r'^/compute/v2\.1/os-quota-sets/([^/]+)(/detail)?$', 'nova',
+          self.computeQuota),
+      ('GET', r'^/compute/v2\.1/limits$', 'nova', self.computeLimits),
+      ('GET', r'^/compute/v2\.1/servers(/detail)?$', 'nova', self.servers),
+      ('GET', r'^/volume(/v3(/[^/]+)?)?/?$', 'cinder', self.volumeVersion),
+      ('GET', r'^/volume/v3/[^/]+/os-quota-sets/([^/]+)$', 'cinder',
+          self.volumeQuota),
+      ('GET', r'^/volume/v3/[^/]+/volumes(/detail)?$', 'cinder', self.volumes),
+      ('GET', r'^/network(/v2\.0)?/?$', 'neutron', self.networkVersion),
+      ('GET', r'^/network/v2\.0/quotas/([^/]+)(\.json)?$', 'neutron',
+          self.networkQuota),
+      ('GET', r'^/admin/user$', 'rgw', self.rgwUser),
+      ('GET', r'^/admin/bucket$', 'rgw', self.rgwBuckets),
+    ]
+
+  def countCall(self, service):
+    with self.lock:
+      self.calls[service] = self.calls.get(service, 0) + 1
+
+  def getCalls(self):
+    """ Returns a copy of the number of calls received per service """
+
+    with self.lock:
+      return dict(self.calls)
+
+  def dispatch(self, method, path, query, body):
+    """ Finds the route matching a request, and returns its response
+
+    Returns a (status, headers, body) tuple. Requests not matching any route
+    are answered with a 404, and counted as 'unmatched'.
+    """
+
+    for rmethod, pattern, service, function in self.routes:
+      m = re.match(pattern, path)
+      if(rmethod == method and m):
+        self.countCall(service)
+        time.sleep(self.latency)
+        return function(m, query, body)
+
+    self.countCall('unmatched')
+    return (404, {}, {'error': {'code': 404, 'message': 'Not stubbed'}})
+
+  def link(self, path):
+    return [{'rel': 'self', 'href': self.url + path}]
+
+  def identityVersion(self, m, query, body):
+    return (200, {}, {'version': {
+      'id': 'v3.14', 'status': 'stable', 'updated': '2020-04-07T00:00:00Z',
+      'links': self.link('/identity/v3/'),
+      'media-types': [{'base': 'application/json',
+          'type': 'application/vnd.openstack.identity-v3+json'}],
+    }})
+
+  def token(self, m, query, body):
+    catalog = []
+    for service, name, path in [
+        ('identity', 'keystone', '/identity/v3'),
+        ('compute', 'nova', '/compute/v2.1'),
+        ('volumev3', 'cinderv3', '/volume/v3/%s' % self.admin_project),
+        ('block-storage', 'cinder', '/volume/v3/%s' % self.admin_project),
+        ('network', 'neutron', '/network')]:
+      catalog.append({'id': hexid(), 'type': service, 'name': name,
+        'endpoints': [{'id': hexid(), 'interface': interface,
+          'region': 'benchmark', 'region_id': 'benchmark',
+          'url': self.url + path} for interface in
+          ['public', 'internal', 'admin']],
+      })
+
+    return (201, {'X-Subject-Token': hexid()}, {'token': {
+      'methods': ['password'],
+      'expires_at': '2099-01-01T00:00:00.000000Z',
+      'issued_at': '2020-01-01T00:00:00.000000Z',
+      'user': {'id': hexid(), 'name': 'cloudadmin',
+          'domain': {'id': 'default', 'name': 'Default'}},
+      'project': {'id': self.admin_project, 'name': 'admin',
+          'domain': {'id': 'default', 'name': 'Default'}},
+      'roles': [{'id': self.roles['admin'], 'name': 'admin'}],
+      'catalog': catalog,
+    }})
+
+  def getCollection(self, kind):
+    if(kind == 'domains'):
+      return {'default': self.fixtures['domain']}
+    return self.fixtures[kind]
+
+  def identityList(self, m, query, body):
+    kind = m.group(1)
+    items = list(self.getCollection(kind).values())
+    for key in ['name', 'domain_id']:
+      if(key in query):
+        items = [i for i in items if i.get(key) == query[key][0]]
+
+    return (200, {}, {kind: items, 'links': {'self': self.url + '/identity/v3/'
+        + kind, 'next': None, 'previous': None}})
+
+  def identityGet(self, m, query, body):
+    kind, item_id = m.groups()
+    item = self.getCollection(kind).get(item_id)
+    if(item is None):
+      return (404, {}, {'error': {'code': 404, 'message': 'Not found'}})
+    return (200, {}, {kind[:-1]: item})
+
+  def roleAssignments(self, m, query, body):
+    """ Every user and group have the _member_ role in every project, and the
+    first user is also the project's cloudadmin. """
+
+    project_id = query.get('scope.project.id', [None])[0]
+    user_id = query.get('user.id', [None])[0]
+    projects = [project_id] if project_id else self.fixtures['projects']
+
+    admin = next(iter(self.fixtures['users']), None)
+    assignments = []
+    for p in projects:
+      for kind in ['user', 'group']:
+        for principal_id in self.fixtures[kind + 's']:
+          if(user_id and principal_id != user_id):
+            continue
+          roles = [self.roles['_member_']]
+          if(principal_id == admin):
+            roles.append(self.roles['cloudadmin'])
+          for role_id in roles:
+            assignments.append({
+              'role': {'id': role_id},
+              kind: {'id': principal_id},
+              'scope': {'project': {'id': p}},
+              'links': {'assignment': self.url},
+            })
+
+    return (200, {}, {'role_assignments': assignments,
+        'links': {'self': self.url, 'next': None, 'previous': None}})
+
+  def noContent(self, m, query, body):
+    return (204, {}, None)
+
+  def computeVersion(self, m, query, body):
+    return (200, {}, {'versions': [{'id': 'v2.1', 'status': 'CURRENT',
+        'version': '2.79', 'min_version': '2.1',
+        'updated': '2013-07-23T11:33:21Z',
+        'links': self.link('/compute/v2.1/')}]})
+
+  def computeQuota(self, m, query, body):
+    return (200, {}, {'quota_set': {'id': m.group(1), 'instances': 10,
+        'cores': 20, 'ram': 51200, 'key_pairs': 100, 'metadata_items': 128,
+        'server_groups': 10, 'server_group_members': 10,
+        'injected_files': 5, 'injected_file_content_bytes': 10240,
+        'injected_file_path_bytes': 255}})
+
+  def computeLimits(self, m, query, body):
+    return (200, {}, {'limits': {'rate': [], 'absolute': {
+      'maxTotalInstances': 10, 'maxTotalCores': 20, 'maxTotalRAMSize': 51200,
+      'maxTotalKeypairs': 100, 'maxServerMeta': 128, 'maxServerGroups': 10,
+      'maxServerGroupMembers': 10, 'maxImageMeta': 128,
+      'maxPersonality': 5, 'maxPersonalitySize': 10240,
+      'maxSecurityGroups': 10, 'maxSecurityGroupRules': 20,
+      'maxTotalFloatingIps': 10,
+      'totalInstancesUsed': 4, 'totalCoresUsed': 8, 'totalRAMUsed': 16384,
+      'totalServerGroupsUsed': 0, 'totalSecurityGroupsUsed': 1,
+      'totalFloatingIpsUsed': 0,
+    }}})
+
+  def servers(self, m, query, body):
+    return (200, {}, {'servers': []})
+
+  def volumeVersion(self, m, query, body):
+    return (200, {}, {'versions': [{'id': 'v3.0', 'status': 'CURRENT',
+        'version': '3.59', 'min_version': '3.0',
+        'updated': '2016-02-08T12:20:21Z', 'links': self.link('/volume/v3/')}]})
+
+  def volumeQuota(self, m, query, body):
+    quota = {'id': m.group(1), 'gigabytes': 1000, 'volumes': 10,
+        'snapshots': 10, 'backups': 10, 'backup_gigabytes': 1000,
+        'per_volume_gigabytes': -1, 'groups': 10}
+    for vtype in ['Slow', 'Normal', 'Fast', 'VeryFast', 'Unlimited']:
+      quota['volumes_%s' % vtype] = -1 if vtype in ['Slow', 'Normal'] else 0
+      quota['gigabytes_%s' % vtype] = quota['volumes_%s' % vtype]
+      quota['snapshots_%s' % vtype] = -1
+    return (200, {}, {'quota_set': quota})
+
+  def volumes(self, m, query, body):
+    project_id = query.get('project_id', [None])[0]
+    projects = [project_id] if project_id else self.fixtures['projects']
+
+    volumes = []
+    for p in projects:
+      for i in range(2):
+        volumes.append({'id': hexid(), 'name': 'volume%d' % i, 'size': 50,
+            'status': 'in-use', 'os-vol-tenant-attr:tenant_id': p,
+            'attachments': [], 'metadata': {}, 'links': []})
+    return (200, {}, {'volumes': volumes})
+
+  def networkVersion(self, m, query, body):
+    return (200, {}, {'versions': [{'id': 'v2.0', 'status': 'CURRENT',
+        'links': self.link('/network/v2.0/')}]})
+
+  def networkQuota(self, m, query, body):
+    return (200, {}, {'quota': {'subnet': 10, 'network': 10,
+        'security_group_rule': 100, 'security_group': 10,
+        'floatingip': 10, 'router': 10, 'port': 50, 'loadbalancer': 10,
+        'subnetpool': -1, 'rbac_policy': 10}})
+
+  def rgwUser(self, m, query, body):
+    uid = query.get('uid', [''])[0]
+    if('quota' in query):
+      return (200, {}, {'enabled': True, 'check_on_raw': False,
+          'max_size': 10 * 1024**3, 'max_size_kb': 10 * 1024**2,
+          'max_objects': 100000})
+    return (200, {}, {'user_id': uid, 'display_name': uid, 'keys': [],
+        'suspended': 0, 'max_buckets': 1000})
+
+  def rgwBuckets(self, m, query, body):
+    uid = query.get('uid', [None])[0]
+    if(uid):
+      owners = [uid]
+    else:
+      owners = ['%s$%s' % (p, p) for p in self.fixtures['projects']]
+
+    return (200, {}, [{'bucket': 'bucket%d' % i, 'owner': owner,
+        'usage': {'rgw.main': {'size': 1024**3, 'num_objects': 1000}}}
+        for owner in owners for i in range(2)])
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+  """ Passes the requests to the stub-server, and writes the responses """
+
+  protocol_version = 'HTTP/1.1'
+
+  def handle_one(self):
+    url = urlparse(self.path)
+    query = parse_qs(url.query, keep_blank_values=True)
+    length = int(self.headers.get('Content-Length') or 0)
+    body = self.rfile.read(length) if length else b''
+
+    status, headers, data = self.server.dispatch(self.command, url.path,
+        query, body)
+    payload = json.dumps(data).encode('utf-8') if data is not None else b''
+
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(payload)))
+    for key, value in headers.items():
+      self.send_header(key, value)
+    self.end_headers()
+    self.wfile.write(payload)
+
+  do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_one
+
+  def log_message(self, format, *args):
+    pass
+
+def configureForStub(stub):
+  """ Points the openstack and ceph settings at the stub-server """
+
+  host = stub.url.split('://', 1)[1]
+  for section, options in [
+      ('openstack', {'auth_url': stub.url + '/identity/v3',
+          'region': 'benchmark', 'domain_name': 'default',
+          'project_name': 'admin', 'user_domain_name': 'default',
+          'username': 'cloudadmin', 'password': 'benchmark',
+          'default_project_domain_id': 'default'}),
+      ('ceph-admin', {'server': host, 'secure': 'false',
+          'access_key': 'benchmark', 'secret_key': 'benchmark'})]:
+    if(not parser.has_section(section)):
+      parser.add_section(section)
+    for key, value in options.items():
+      parser.set(section, key, value)
+
+def createDatabaseFixtures(members):
+  """ Creates the users and the cloudadmin project used by the benchmark
+
+  Returns a (superuser, ldap_attributes) tuple, where the ldap_attributes can
+  be used to sync the group-memberships of a user in a certain number of
+  groups.
+  """
+
+  user = User.objects.create_superuser('benchmark', 'benchmark@example.com',
+      'benchmark')
+  group = Group.objects.create(name='benchmark')
+  user.groups.add(group)
+
+  project = Project(id=1, name='Benchmark', description='Benchmark',
+      projectprefix='BENCH', quota=Quota.objects.create(),
+      usage=Usage.objects.create())
+  project.save()
+  project.groups.add(group)
+
+  ldap_attributes = {LDAP_AUTH_MEMBER_OF_ATTRIBUTE: [
+      'CN=group%04d,OU=Groups,DC=example,DC=com' % i for i in range(members)]}
+  return (user, ldap_attributes)
+
+def getScenarios(stub, user, ldap_attributes):
+  """ Returns a list of (name, function) tuples, one for each thing to time """
+
+  factory = RequestFactory()
+  osconnection = getOpenstackConnection()
+  project_id = next(iter(stub.fixtures['projects']))
+  member = next(iter(stub.fixtures['users'].values()))
+
+  def request(method, path, data = None):
+    r = getattr(factory, method)(path, data or {})
+    r.user = user
+    return r
+
+  def index():
+    return endpoints.index(request('get', '/api/v1/openstack/project/'))
+
+  def single():
+    return endpoints.single(request('get', '/api/v1/openstack/project/%s/' %
+        project_id), project_id)
+
+  def singlemembers():
+    return endpoints.single(request('get', '/api/v1/openstack/project/%s/' %
+        project_id, {'include': 'members'}), project_id)
+
+  def assignments():
+    return endpoints.assignments(request('post',
+        '/api/v1/openstack/project/%s/assignments' % project_id,
+        {'access': '_member_', 'type': 'user', 'name': member['name'],
+        'domain': 'default'}), project_id)
+
+  def project():
+    return getOpenstackProject(osconnection, project_id)
+
+  def sync():
+    LDAPSyncState.objects.filter(user=user).delete()
+    return custom_sync_user_relations(user, ldap_attributes)
+
+  return [
+    ('endpoints.openstack.index', index),
+    ('endpoints.openstack.single', single),
+    ('endpoints.openstack.single?include=members', singlemembers),
+    ('endpoints.openstack.assignments', assignments),
+    ('openstack.getOpenstackProject', project),
+    ('ldap.custom_sync_user_relations', sync),
+  ]
+
+def runScenario(stub, function, iterations, warm = False):
+  """ Runs a scenario a number of times, and measures each run.
+
+  The cache is cleared before each run, unless warm is True. Returns a dict
+  with the median and maximum latency (in milliseconds), and the average
+  number of backend-calls (per service) and database-queries per run.
+  """
+
+  latencies = []
+  calls = {}
+  queries = 0
+
+  for i in range(iterations):
+    if(not warm):
+      cache.clear()
+
+    before = stub.getCalls()
+    with CaptureQueriesContext(connection) as captured:
+      start = time.perf_counter()
+      function()
+      latencies.append((time.perf_counter() - start) * 1000)
+    queries += len(captured)
+
+    for service, count in stub.getCalls().items():
+      calls[service] = calls.get(service, 0) + count - before.get(service, 0)
+
+  return {
+    'median_ms': statistics.median(latencies),
+    'max_ms': max(latencies),
+    'calls': {s: c / iterations for s, c in calls.items() if c},
+    'queries': queries / iterations,
+  }
@@ -0,0 +1,146 @@
+""" Circuit-breakers protecting cloudadmin from unavailable backends
+
+This module contains a simple circuit-breaker per backend. When calls to a
+backend fail repeatedly (ie: it can not be reached, it times out, or it
+returns server-errors), the breaker opens, and further calls fail immediately
+with a BackendUnavailableException instead of waiting for the backend to time
+out. After a while a call is let through again, and the breaker closes if it
+succeeds.
+"""
+
+import threading
+import time
+
+from configparser import NoOptionError, NoSectionError
+from functools import wraps
+
+import requests
+
+from keystoneauth1.exceptions import ConnectionError as KeystoneConnectionError
+from keystoneauth1.exceptions import HttpError as KeystoneHttpError
+
+from cloudadmin.exceptions import BackendUnavailableException
+from cloudadmin.metrics import getOpenstackService
+from cloudadmin.settings import parser
+
+breakers = {}
+breakerlock = threading.Lock()
+
+def getBreakerSetting(name, default):
+  """ Returns an integer from the breaker-section of the configuration-file """
+
+  try:
+    return parser.getint('breaker', name)
+  except (NoSectionError, NoOptionError, ValueError):
+    return default
+
+class CircuitBreaker(object):
+  """ A circuit-breaker for a single backend.
+
+  The breaker opens after 'threshold' consecutive failures, and stays open for
+  'reset' seconds. After that calls are let through again; a single failure
+  re-opens the breaker, while a success closes it.
+  """
+
+  def __init__(self, name, threshold, reset):
+    self.name = name
+    self.threshold = threshold
+    self.reset = reset
+    self.failures = 0
+    self.openuntil = 0
+    self.lock = threading.Lock()
+
+  def isOpen(self):
+    """ Returns True if calls to the backend should be rejected """
+
+    with self.lock:
+      return self.failures >= self.threshold and \
+          time.monotonic() < self.openuntil
+
+  def recordFailure(self):
+    with self.lock:
+      self.failures += 1
+      if(self.failures >= self.threshold):
+        self.openuntil = time.monotonic() + self.reset
+
+  def recordSuccess(self):
+    with self.lock:
+      self.failures = 0
+
+  def call(self, failures, function, *args, **kwargs):
+    """ Calls a function through the breaker.
+
+    Exceptions of the types in 'failures' are counted as failures, and are
+    raised as a BackendUnavailableException. Responses with a status-code of
+    500 or above, and keystoneauth's HttpErrors with such a status-code, are
+    also counted as failures, but are returned or raised as they are. Raises a
+    BackendUnavailableException without calling the function if the breaker is
+    open.
+    """
+
+    if(self.isOpen()):
+      raise BackendUnavailableException('%s is unavailable' % self.name)
+
+    try:
+      result = function(*args, **kwargs)
+    except failures as e:
+      self.recordFailure()
+      raise BackendUnavailableException('%s is unavailable: %s' %
+          (self.name, e)) from e
+    except KeystoneHttpError as e:
+      if((e.http_status or 0) >= 500):
+        self.recordFailure()
+      else:
+        self.recordSuccess()
+      raise
+
+    if(getattr(result, 'status_code', 0) >= 500):
+      self.recordFailure()
+    else:
+      self.recordSuccess()
+
+    return result
+
+def getCircuitBreaker(name):
+  """ Returns the circuit-breaker of a certain backend
+
+  The breakers opens after 'threshold' consecutive failures, and stays open
+  for 'reset' seconds, as set in the breaker-section of the
+  configuration-file (defaulting to 5 failures and 30 seconds).
+  """
+
+  with breakerlock:
+    if(name not in breakers):
+      breakers[name] = CircuitBreaker(name, getBreakerSetting('threshold', 5),
+          getBreakerSetting('reset', 30))
+    return breakers[name]
+
+def protectedFunction(backend, failures, function):
+  """ Wraps a function so that every call to it goes through a breaker.
+
+  The backend is either a string, or a function which is called with the same
+  arguments as the wrapped function and returns the name of the backend.
+  """
+
+  @wraps(function)
+  def wrapper(*args, **kwargs):
+    name = backend(*args, **kwargs) if callable(backend) else backend
+    return getCircuitBreaker(name).call(failures, function, *args, **kwargs)
+  return wrapper
+
+def protectOpenstackConnection(connection):
+  """ Makes every request sent through an openstack connection go through the
+  circuit-breaker of the openstack service it is sent to. """
+
+  connection.session.request = protectedFunction(getOpenstackService,
+      (KeystoneConnectionError,), connection.session.request)
+  return connection
+
+def protectRGWConnection(connection):
+  """ Makes every request sent through a RGWAdmin connection go through the
+  circuit-breaker of the rgw's. """
+
+  connection.request = protectedFunction('rgw',
+      (requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+      connection.request)
+  return connection
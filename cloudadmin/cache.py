@@ -0,0 +1,311 @@
+""" Utility methods to cache information retrieved from openstack
+
+This module contains methods which keeps information about openstack projects
+in django's cache for a short while, so that requests following each other
+closely do not have to query the openstack API's for the same information.
+Everything cached about a project is stored under a key consisting of the
+project's ID and the name of the facet (the kind of information) cached.
+
+Cached values are kept for a while after they expire. Read-only views can ask
+for an expired value to be returned (marked as stale) while it is refreshed in
+the background, so that a slow or unavailable backend does not block them.
+Access-checks and write-paths never get expired values, and write-paths can
+bypass the cache altogether. Concurrent requests for a value which is not
+cached share a single call to the backend.
+
+Each project has a generation-number, which is increased whenever the project
+is invalidated. A value calculated for a project is only cached if the
+generation is unchanged when the calculation finishes, so that a calculation
+started before the project was changed can not cache outdated information.
+"""
+
+import threading
+import time
+
+from configparser import NoOptionError, NoSectionError
+
+from django.core.cache import cache
+from django.db import connections
+
+from cloudadmin.settings import parser
+
+# The values currently being calculated by a thread in this process, indexed
+# by their cache-key.
+inflight = {}
+inflightlock = threading.Lock()
+
+# The facets which can be cached for an openstack project.
+projectfacets = [
+  'assignments',
+  'members',
+  'meta',
+  'quota',
+  'swift',
+  'usage',
+]
+
+def getCacheTimeout():
+  """ Returns the number of seconds information should be cached
+
+  The value is read from the setting 'timeout' in the cache-section of the
+  configuration-file, and defaults to 30 seconds.
+  """
+
+  try:
+    return parser.getint('cache', 'timeout')
+  except (NoSectionError, NoOptionError, ValueError):
+    return 30
+
+def getStaleTimeout():
+  """ Returns the number of seconds an expired value can still be returned
+
+  The value is read from the setting 'stale' in the cache-section of the
+  configuration-file, and defaults to 300 seconds.
+  """
+
+  try:
+    return parser.getint('cache', 'stale')
+  except (NoSectionError, NoOptionError, ValueError):
+    return 300
+
+def getLockTimeout():
+  """ Returns the number of seconds to wait for another process calculating a
+  value before calculating it anyway
+
+  The value is read from the setting 'lock_timeout' in the cache-section of the
+  configuration-file, and defaults to 10 seconds.
+  """
+
+  try:
+    return parser.getint('cache', 'lock_timeout')
+  except (NoSectionError, NoOptionError, ValueError):
+    return 10
+
+def getProjectCacheKey(project_id, facet):
+  """ Returns the cache-key used for a certain facet of an openstack project """
+
+  return 'cloudadmin:osproject:%s:%s' % (project_id, facet)
+
+def getProjectGenerationKey(project_id):
+  """ Returns the cache-key of the generation-number of an openstack project """
+
+  return 'cloudadmin:osproject:%s:generation' % project_id
+
+def getGeneration(generationkey):
+  """ Returns the current value of a generation-number, or None if no key is
+  supplied """
+
+  if(generationkey is None):
+    return None
+  return cache.get(generationkey, 0)
+
+def setCachedValue(key, value, generationkey = None, generation = None):
+  """ Stores a value in the cache, together with the time it was calculated
+
+  If a generation-key is supplied, the value is only stored if the generation
+  still is the one read before the value was calculated.
+  """
+
+  if(generationkey is not None and getGeneration(generationkey) != generation):
+    return
+
+  cache.set(key, {'value': value, 'time': time.time()},
+      getCacheTimeout() + getStaleTimeout())
+
+def refreshCachedValue(key, function, *args, generationkey = None):
+  """ Calculates a value and stores it in the cache.
+
+  Used to refresh stale values in the background. Errors are ignored, so that
+  the stale value is kept until it can be refreshed.
+  """
+
+  try:
+    generation = getGeneration(generationkey)
+    setCachedValue(key, function(*args), generationkey, generation)
+  except Exception:
+    pass
+  finally:
+    cache.delete('%s:refresh' % key)
+    connections.close_all()
+
+class Flight(object):
+  """ A value being calculated by a thread, which other threads can wait for """
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.value = None
+    self.error = None
+
+def calculateSharedValue(key, function, *args, generationkey = None):
+  """ Calculates a value and stores it in the cache, unless another process
+  sharing the cache is already calculating it.
+
+  The process calculating the value holds a lock in the cache. Other processes
+  wait for an unexpired value to appear in the cache, until the lock is
+  released or the lock-timeout is reached, before they calculate it
+  themselves.
+  """
+
+  lockkey = '%s:lock' % key
+  locked = cache.add(lockkey, True, getLockTimeout())
+
+  if(not locked):
+    deadline = time.monotonic() + getLockTimeout()
+    while(time.monotonic() < deadline):
+      time.sleep(0.05)
+      entry = cache.get(key)
+      if(entry is not None and time.time() - entry['time'] < getCacheTimeout()):
+        return entry['value']
+      if(cache.get(lockkey) is None):
+        break
+
+  try:
+    generation = getGeneration(generationkey)
+    value = function(*args)
+    setCachedValue(key, value, generationkey, generation)
+  finally:
+    if(locked):
+      cache.delete(lockkey)
+
+  return value
+
+def calculateValue(key, function, *args, generationkey = None):
+  """ Calculates a value which is not cached, and caches it.
+
+  Concurrent calculations of the same key share a single call to the function;
+  threads in this process wait for the thread calling it, and other processes
+  sharing the cache wait for the value to appear in the cache (see
+  calculateSharedValue). Errors are raised in all the waiting threads.
+  """
+
+  with inflightlock:
+    flight = inflight.get(key)
+    leader = flight is None
+    if(leader):
+      flight = inflight[key] = Flight()
+
+  if(not leader):
+    flight.done.wait()
+    if(flight.error is not None):
+      raise flight.error
+    return flight.value
+
+  try:
+    flight.value = calculateSharedValue(key, function, *args,
+        generationkey=generationkey)
+  except Exception as e:
+    flight.error = e
+    raise
+  finally:
+    with inflightlock:
+      if(inflight.get(key) is flight):
+        del inflight[key]
+    flight.done.set()
+
+  return flight.value
+
+def getCachedEntry(key, function, *args, stale = False, fresh = False,
+    generationkey = None):
+  """ Retrieves a value from the cache, or calculates it if it is not cached.
+
+  If the key is cached, and the cached value have not expired, the cached value
+  is returned. Otherwise the supplied function is called with the supplied
+  arguments, and its return-value is cached and returned. Concurrent requests
+  for a value which needs to be calculated share one calculation (see
+  calculateValue).
+
+  If 'stale' is True, an expired value is returned as it is, and refreshed in a
+  background-thread; only one refresh is started per key, even when several
+  processes share the cache. This should only be used by read-only views. If
+  'fresh' is True, the cache is bypassed, and the value is always calculated
+  (and cached) by the calling thread. The generation-key is passed on to
+  setCachedValue.
+
+  Returns a tuple (value, stale), where stale is True if the value have
+  expired.
+  """
+
+  if(fresh):
+    generation = getGeneration(generationkey)
+    value = function(*args)
+    setCachedValue(key, value, generationkey, generation)
+    return (value, False)
+
+  entry = cache.get(key)
+
+  if(entry is None):
+    return (calculateValue(key, function, *args,
+        generationkey=generationkey), False)
+
+  if(time.time() - entry['time'] < getCacheTimeout()):
+    return (entry['value'], False)
+
+  if(not stale):
+    return (calculateValue(key, function, *args,
+        generationkey=generationkey), False)
+
+  if(cache.add('%s:refresh' % key, True, getCacheTimeout())):
+    threading.Thread(target=refreshCachedValue, args=(key, function) + args,
+        kwargs={'generationkey': generationkey}, daemon=True).start()
+
+  return (entry['value'], True)
+
+def getCachedValue(key, function, *args, stale = False, fresh = False):
+  """ Retrieves a value from the cache, or calculates it if it is not cached.
+
+  See getCachedEntry for details. Only the value is returned.
+  """
+
+  return getCachedEntry(key, function, *args, stale=stale, fresh=fresh)[0]
+
+def getCachedProjectFacetEntry(project_id, facet, function, *args,
+    stale = False, fresh = False):
+  """ Retrieves a facet of an openstack project, using the cache if possible.
+
+  See getCachedEntry for details. The value is only cached if the project is
+  not invalidated while it is calculated.
+  """
+
+  return getCachedEntry(getProjectCacheKey(project_id, facet), function, *args,
+      stale=stale, fresh=fresh,
+      generationkey=getProjectGenerationKey(project_id))
+
+def getCachedProjectFacet(project_id, facet, function, *args, stale = False,
+    fresh = False):
+  """ Retrieves a facet of an openstack project, using the cache if possible.
+
+  See getCachedProjectFacetEntry for details. Only the value is returned.
+  """
+
+  return getCachedProjectFacetEntry(project_id, facet, function, *args,
+      stale=stale, fresh=fresh)[0]
+
+def invalidateProject(project_id, facets = None):
+  """ Removes everything cached about a certain openstack project
+
+  If a list of facets is supplied, only those facets are removed, ie: when
+  only the role-assignments of the project have changed. Calculations of the
+  removed facets which are already running are forgotten, so that later
+  requests do not wait for their (outdated) results. The project's
+  generation-number is increased, so that the running calculations (and
+  background-refreshes) do not cache their results either.
+  """
+
+  if(facets is None):
+    facets = projectfacets
+  keys = [getProjectCacheKey(project_id, facet) for facet in facets]
+
+  # The generation-number is never expired, as an expired number would let
+  # calculations started before the invalidation cache their results.
+  generationkey = getProjectGenerationKey(project_id)
+  cache.add(generationkey, 0, None)
+  try:
+    cache.incr(generationkey)
+  except ValueError:
+    cache.set(generationkey, 1, None)
+
+  with inflightlock:
+    for key in keys:
+      inflight.pop(key, None)
+
+  cache.delete_many(keys + ['%s:lock' % key for key in keys])
@@ -4,9 +4,13 @@ This module contains methods designed to aid the interaction with the ceph rados
 gateways. The ceph rgw's are responsible for our swift and S3 api's.
 """
 
+from configparser import NoOptionError
+
 from rgwadmin import RGWAdmin
-from rgwadmin.exceptions import NoSuchUser
+from rgwadmin.exceptions import NoSuchUser, RGWAdminException
 
+from cloudadmin.breaker import protectRGWConnection
+from cloudadmin.metrics import instrumentRGWConnection
 from cloudadmin.utils import humanReadable
 from cloudadmin.settings import parser
 
@@ -15,18 +19,33 @@ def getRGWConnection():
 
   This method collects keys and endpoint from the configuration-file and creates
   a RGWAdmin connection-object which can be used to interact with the ceph RGW.
+  The endpoint is contacted using https unless 'secure' is set to false in the
+  ceph-admin section. Requests time out after 'timeout' seconds (defaulting to
+  10), and are sent through the circuit-breaker of the rgw's.
 
   Returns:
     A RGWAdmin object
   """
 
+  try:
+    secure = parser.getboolean('ceph-admin', 'secure')
+  except (NoOptionError, ValueError):
+    secure = True
+
+  try:
+    timeout = parser.getint('ceph-admin', 'timeout')
+  except (NoOptionError, ValueError):
+    timeout = 10
+
   connection = RGWAdmin(
     access_key = parser.get('ceph-admin', 'access_key'),
     secret_key = parser.get('ceph-admin', 'secret_key'),
     server = parser.get('ceph-admin', 'server'), 
+    secure = secure,
+    timeout = timeout,
   ) 
 
-  return connection
+  return protectRGWConnection(instrumentRGWConnection(connection))
 
 def getRGWUserQuota(uid):
   """ Retrieves a certain user's quota from the ceph rgw's
@@ -95,7 +114,7 @@ def getRGWUserUsage(uid):
 
   try:
     quota = rgw.get_quota(uid, quota_type = 'user')
-  except:
+  except RGWAdminException:
     quota = {'enabled': False}
 
   if(quota['enabled']):
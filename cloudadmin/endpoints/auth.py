@@ -6,6 +6,7 @@ from django.http import JsonResponse, HttpResponseForbidden,\
 from django.views.decorators.csrf import csrf_exempt
 
 from cloudadmin.decorators import apiauth
+from cloudadmin.middleware import tokencache
 from cloudadmin.models import Token
 
 @csrf_exempt
@@ -21,8 +22,9 @@ def auth(request):
 
   If the username and password are valid a token will be generated, and a JSON
   structure will be returned with three elements:
-    token: A string which needs to be provided through POST with the key
-           "api_key" to use other API endpoints.
+    token: A string which needs to be provided in an "Authorization: Bearer"
+           header (or through GET/POST with the key "api_key") to use other
+           API endpoints.
     expiry: A UTC time telling when the token expires
     valid: A boolean telling if the token is valid or not.
 
@@ -37,10 +39,9 @@ def auth(request):
     )
     if(user):
       token = Token(user = user)
-      token.generateToken()
-      token.save()
+      value = token.generateToken()
       data = {}
-      data['token'] = token.value
+      data['token'] = value
       data['expiry'] = token.expiry
       data['valid'] = token.isValid()
       return JsonResponse(data) 
@@ -56,6 +57,7 @@ def deauth(request):
   """
 
   if(request.token):
+    tokencache.delete(request.token.value_hash)
     request.token.delete()
     return JsonResponse({'message': 'Your token is revoked'}) 
   else:
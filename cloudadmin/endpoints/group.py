@@ -1,23 +1,60 @@
-from django.contrib.auth.models import Group
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse
 
 from cloudadmin.decorators import apiauth_superuser
+from cloudadmin.models import GroupIndex
 
 @apiauth_superuser
 def list(request):
-  """ API view - Lists all groups
+  """ API view - Searches the groups
 
-  A simple view listing up all groups cloudadmin knows about. Only superusers
-  are allowed to use this endpoint.
+  A view searching the groups cloudadmin knows about, ordered by their name.
+  Only superusers are allowed to use this endpoint. The search is done in the
+  group-index, where the groups from LDAP are indexed by their CN. The view
+  accepts the following GET parameters:
+    q:      A string which the (case-insensitive) CN of the groups must start
+            with. All groups are returned if it is not supplied.
+    match:  Set to 'substring' to return groups containing q anywhere in their
+            CN. This can not use the index, and is thus slower.
+    limit:  The maximum number of groups to return. Defaults to 20, and can
+            not be more than 100.
+    offset: The number of groups to skip, for pagination.
+
+  Returns a JSON structure with the list 'groups', and 'next', which is the
+  offset of the next page or null if there are no more groups.
   """
 
+  try:
+    limit = min(int(request.GET.get('limit', 20)), 100)
+    offset = int(request.GET.get('offset', 0))
+  except ValueError:
+    return HttpResponseBadRequest('The limit and offset must be integers')
+  if(limit < 1 or offset < 0):
+    return HttpResponseBadRequest('The limit and offset must be positive')
+
+  query = GroupIndex.objects.select_related('group')
+
+  # The prefix-search is expressed as a range, as LIKE can not use the index
+  # on all databases (ie: SQLite).
+  search = request.GET.get('q', '').strip().lower()
+  if(search and request.GET.get('match') == 'substring'):
+    query = query.filter(cn__contains=search)
+  elif(search):
+    query = query.filter(cn__gte=search, cn__lt=search + '\uffff')
+
+  # Retrieve one more group than requested, to determine if there is a next
+  # page. (The builtin list is shadowed by this view.)
+  entries = [e for e in
+      query.order_by('cn', 'group_id')[offset:offset + limit + 1]]
+
   data = {}
   data['groups'] = []
+  data['next'] = offset + limit if len(entries) > limit else None
 
-  for g in Group.objects.order_by('name').all():
+  for entry in entries[:limit]:
     data['groups'].append({
-      'id':   g.id,
-      'name': g.name,
+      'id':   entry.group.id,
+      'name': entry.group.name,
+      'cn':   entry.cn,
     })
 
-  return JsonResponse(data) 
+  return JsonResponse(data)
@@ -0,0 +1,92 @@
+from django.http import HttpResponseBadRequest, JsonResponse
+
+from cloudadmin.decorators import apiauth_superuser
+from cloudadmin.memberships import getUserGroupNames, offboardUsers
+from cloudadmin.models import ProjectMembership
+from cloudadmin.openstack import getOpenstackConnection, getOpenstackDomains
+
+@apiauth_superuser
+def index(request):
+  """ API view - Lists the openstack projects a user or group have roles in
+
+  A view answering which openstack projects a certain user or group have roles
+  in, using the index of the role-assignments (see cloudadmin.memberships).
+  Only superusers are allowed to use this endpoint. The view accepts the
+  following GET parameters:
+    type:      Either 'user' or 'group'.
+    name:      The (case-insensitive) name of the user or group.
+    id:        The openstack ID of the user or group. Either the name or the ID
+               must be supplied.
+    domain:    Only return memberships of users/groups in this domain.
+    effective: Set to 'true' to include the projects a user have roles in
+               through the groups it is a member of in the LDAP-mirror. Only
+               used when a user is looked up by name.
+
+  Returns a JSON structure with the list 'memberships', where each membership
+  is a dict with the keys 'project_id', 'project_name', 'type', 'id', 'name',
+  'domain' and 'role'.
+  """
+
+  ptype = request.GET.get('type')
+  if(ptype not in [ProjectMembership.USER, ProjectMembership.GROUP]):
+    return HttpResponseBadRequest('The type must be either user or group')
+
+  name = request.GET.get('name', '').strip().lower()
+  principal_id = request.GET.get('id', '').strip()
+  if(not name and not principal_id):
+    return HttpResponseBadRequest('Either a name or an ID must be supplied')
+
+  if(principal_id):
+    query = ProjectMembership.objects.filter(principal_type=ptype,
+        principal_id=principal_id)
+  else:
+    query = ProjectMembership.objects.filter(principal_type=ptype, name=name)
+
+  if(request.GET.get('domain')):
+    query = query.filter(domain=request.GET['domain'])
+
+  memberships = [m.asDict() for m in query.order_by('project_name', 'role')]
+
+  # Add the memberships of the user's groups.
+  if(ptype == ProjectMembership.USER and name and
+      request.GET.get('effective') == 'true'):
+    groups = getUserGroupNames(name)
+    memberships += [m.asDict() for m in ProjectMembership.objects.filter(
+        principal_type=ProjectMembership.GROUP, name__in=groups).order_by(
+        'project_name', 'role')]
+
+  return JsonResponse({'memberships': memberships})
+
+@apiauth_superuser
+def offboard(request):
+  """ API view - Revokes all the project-roles of a list of departed users
+
+  Only superusers are allowed to use this endpoint, and only POST requests are
+  accepted. The view needs the following parameters:
+    username: The username of a user to offboard. Can be supplied multiple
+              times.
+    domain:   The name or ID of the openstack domain of the users.
+    dryrun:   Set to 'true' to only report which roles would be revoked.
+
+  Returns a JSON structure with the list 'results', containing a dict per role
+  (and per user which could not be found or looked up) with the keys
+  'username', 'project_id', 'project_name', 'role', 'status' ('revoked',
+  'dryrun' or 'error') and 'message'. See cloudadmin.memberships.offboardUsers.
+  """
+
+  if(request.method != 'POST'):
+    return HttpResponseBadRequest('Method %s not implemented' % request.method)
+
+  usernames = [u.strip() for u in request.POST.getlist('username') if u.strip()]
+  if(not usernames):
+    return HttpResponseBadRequest('No usernames supplied')
+
+  connection = getOpenstackConnection()
+  domain = getOpenstackDomains(connection, [request.POST.get('domain')]). \
+      get(request.POST.get('domain'))
+  if(not domain):
+    return HttpResponseBadRequest('Invalid domain')
+
+  results = offboardUsers(connection, usernames, domain.id,
+      request.POST.get('dryrun') == 'true')
+  return JsonResponse({'results': results})
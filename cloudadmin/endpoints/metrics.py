@@ -0,0 +1,20 @@
+from django.http import HttpResponse, HttpResponseForbidden
+
+from cloudadmin.metrics import exportMetrics, isAllowedToReadMetrics
+
+def index(request):
+  """ API view - Exports the backend-latency metrics
+
+  This view returns the latency-histograms of the calls to the backends, per
+  backend and per view, in the prometheus text-format. It is available to
+  superusers, and to the networks listed in the setting 'allowed_networks' in
+  the metrics-section of the configuration-file (ie: the prometheus server).
+  The histograms are kept per process, so each worker-process is reporting its
+  own numbers.
+  """
+
+  if(not isAllowedToReadMetrics(request)):
+    return HttpResponseForbidden('No access to the metrics')
+
+  return HttpResponse(exportMetrics(),
+      content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,19 +1,32 @@
 import datetime
+import openstack
 import re
 
 from django.contrib.auth.models import Group
 from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponse, HttpResponseBadRequest, \
     HttpResponseForbidden, JsonResponse, QueryDict
+from django.utils import timezone
 from django.utils.datastructures import MultiValueDictKeyError
 
+from cloudadmin.cache import invalidateProject
+from cloudadmin.ceph import getRGWUserQuota
 from cloudadmin.decorators import apiauth
 from cloudadmin.exceptions import UsageTooHighException
-from cloudadmin.models import Project, QuotaInformation
-from cloudadmin.openstack import createOpenstackProject, \
-  getAndVerifyAccessToOpenstackProject, getOpenstackConnection, \
-  getOpenstackGroup, getOpenstackUser, updateOpenstackProject, validateFormData
+from cloudadmin.memberships import addProjectMemberships, \
+    removeProjectMemberships
+from cloudadmin.models import Project, ProjectMembership, QuotaInformation, \
+    UsageSample
+from cloudadmin.openstack import assignOpenstackRoles, \
+  createOpenstackProject, getAndVerifyAccessToOpenstackProject, \
+  getAndVerifyAccessToOpenstackProjectMeta, getOpenstackConnection, \
+  getOpenstackDomains, getOpenstackGroup, getOpenstackPrincipals, \
+  getOpenstackProject, getOpenstackRegionQuota, getOpenstackRoles, \
+  getOpenstackUser, markOpenstackProjectDeletable, openstackfacets, \
+  parseRoleAssignmentID, revokeOpenstackRoles, rolefacets, \
+  updateOpenstackProject, validateFormData
 from cloudadmin.settings import parser
+from cloudadmin.usage import forecastUsage, getRetention, getUsageHistory
 from cloudadmin.utils import rolenames
 
 @apiauth
@@ -156,6 +169,7 @@ def index(request):
       usage = validated['caproject'].usage
       usage.add(validated['quota'])
       usage.save()
+      invalidateProject(osproject.id)
       return HttpResponse('Project created') 
 
   # If the request is a get request, we return a list over the project the user
@@ -256,7 +270,11 @@ def single(request, projectid):
   the python method, 'projectid').
 
   Requests:
-    GET: Simply returns the specified project as a JSON blob.
+    GET: Simply returns the specified project as a JSON blob. Accepts an
+         optional parameter:
+      include:       A comma-separated list of the parts of the project to
+                     return; any of meta, quota, usage, swift and members.
+                     Defaults to all of them. The metadata is always returned.
     POST: Updates an existing cloudadmin project. There are multiple parameters
           needed to perform a POST request. If any of the parameters differs
           from what the project already have, the project will be updated.
@@ -290,8 +308,27 @@ def single(request, projectid):
 
   conn = getOpenstackConnection()
 
+  # A GET only collects the requested facets of the project.
+  if(request.method == 'GET' and request.GET.get('include')):
+    facets = set(request.GET['include'].split(','))
+    if(facets - set(openstackfacets)):
+      return HttpResponseBadRequest('The include-parameter can only contain ' +
+          ', '.join(openstackfacets))
+  else:
+    facets = None
+
+  # A POST or a DELETE only needs to verify the access to the project, so there
+  # is no need to collect the usage and the role-assignments for it. The
+  # metadata and the quotas they need are read directly from the API's,
+  # bypassing the cache. A GET can be answered with expired information while
+  # it is refreshed.
   try:
-    data = getAndVerifyAccessToOpenstackProject(conn, projectid, request.user)
+    if(request.method in ['POST', 'DELETE']):
+      data = getAndVerifyAccessToOpenstackProjectMeta(conn, projectid,
+          request.user, fresh=True)
+    else:
+      data = getAndVerifyAccessToOpenstackProject(conn, projectid,
+          request.user, facets, stale=True)
   except LookupError:
     raise Http404
 
@@ -345,9 +382,13 @@ def single(request, projectid):
         'The expiry date must be between today and %s' % str(maxlength))
 
     # Calculate the size of the new quotas, and the difference between the
-    # existing and the new.
+    # existing and the new. The existing quotas are read from the API's, as a
+    # cached copy might not reflect the latest changes. Only the quotas of the
+    # connection's own region are updated, so the other regions are left out.
+    quota = getOpenstackRegionQuota(conn, data['id'])
+    quota['swift'] = getRGWUserQuota('%s$%s' % (data['id'], data['id']))
     old = QuotaInformation()
-    old.fromDict(data['quota'])
+    old.fromDict(quota)
     diff = QuotaInformation()
     diff.add(validated['quota'])
     diff.subtract(old)
@@ -426,51 +467,22 @@ def single(request, projectid):
       else:
         usage.add(diff)
       usage.save()
+      invalidateProject(data['id'])
 
-    return JsonResponse(data)
+    # Return the updated project with all its facets, just as a GET would. It
+    # is read after the tags are changed, so that the association to the
+    # cloudadmin project is current.
+    updated = getOpenstackProject(conn, data['id'], fresh=True)
+    updated['write'] = data['write']
+    updated['adminurl'] = data['adminurl']
+    updated['infourl'] = data['infourl']
+    return JsonResponse(updated)
 
   elif request.method == 'DELETE':
     if not data['write']:
       return HttpResponseForbidden('No write access to project')
 
-    osproject = conn.identity.get_project(data['id'])
-    roles = {}
-
-    # Remove all users from the project
-    roleAssignments = conn.list_role_assignments(filters={'project':data['id']})
-    for ra in roleAssignments:
-      if(ra['id'] not in roles):
-        roles[ra['id']] = conn.identity.get_role(ra['id'])
-
-      if('user' in ra):
-        user = conn.identity.get_user(ra['user'])
-        osproject.unassign_role_from_user(conn.identity, user,
-            roles[ra['id']])
-      if('group' in ra):
-        group = conn.identity.get_group(ra['group'])
-        osproject.unassign_role_from_group(conn.identity, group, 
-            roles[ra['id']])
-
-    # Stop all VM's in the project
-    for server in conn.list_servers(all_projects=True, 
-        filters={'project_id': data['id']}):
-      conn.compute.stop_server(server['id'])
-
-    # Mark the project for deletion
-    osproject.add_tag(conn.identity, 'DELETABLE')
-    osproject.description = "DELETABLE: %s" % osproject.description
-    osproject.commit(conn.identity)
-
-    # If the openstack-project was associated with a caproject; decrease the
-    # caproject's usage according to what the project's quotas.
-    if('CloudAdminProject' in data):
-      osproject.remove_tag(conn.identity, 
-          'CloudAdminProject=%d' % int(data['CloudAdminProject']))
-      caproject = Project.objects.get(pk=int(data['CloudAdminProject'])) 
-      osuse = QuotaInformation()
-      osuse.fromDict(data['quota'])
-      caproject.removeUsage(osuse)
-
+    markOpenstackProjectDeletable(conn, data['id'])
     return HttpResponse("Project marked for deletion") 
 
   # If it is neither a GET nor a POST or a DELETE request; return an error
@@ -497,14 +509,17 @@ def assignments(request, projectid):
               id:     A string containing the ID of a user or a group, and the
                       name of the role to be removed in the following format:
                         <user_id|group_id>:<rolename>
+            Whether the ID belongs to a user or a group is determined from the
+            project's role-assignment index.
   """
 
   conn = getOpenstackConnection()
 
-  # Retrieve the openstack-project, and make sure that the requesting user have
-  # access to it.
+  # Retrieve the openstack-project's current metadata, and make sure that the
+  # requesting user have access to it.
   try:
-    data = getAndVerifyAccessToOpenstackProject(conn, projectid, request.user)
+    data = getAndVerifyAccessToOpenstackProjectMeta(conn, projectid,
+        request.user, fresh=True)
   except LookupError:
     raise Http404
 
@@ -529,7 +544,7 @@ def assignments(request, projectid):
     # Retrieve the role from openstack
     try:
       role = conn.identity.find_role(request.POST['access'])
-    except:
+    except openstack.exceptions.SDKException:
       return HttpResponseBadRequest('Could not find role')
 
     # Sanitize user input which are free-text:
@@ -545,7 +560,7 @@ def assignments(request, projectid):
     # Retrieve the domain from openstack. 
     try:
       domain = conn.identity.find_domain(domain_name)
-    except: 
+    except openstack.exceptions.SDKException:
       return HttpResponseBadRequest('Could not retrieve domain from openstack')
     if not domain:
       return HttpResponseBadRequest('Domain does not exist')
@@ -560,8 +575,11 @@ def assignments(request, projectid):
       # Add the role in the project to the user
       try:
         conn.identity.assign_project_role_to_user(data['id'], user, role)
-      except:
+      except openstack.exceptions.SDKException:
         return HttpResponseBadRequest('Could not assign role to user')
+      invalidateProject(data['id'], rolefacets)
+      addProjectMemberships(data, [(ProjectMembership.USER, user.id,
+          user.name, domain.name, role.name)])
         
       # Return a status 200 OK
       return HttpResponse('User got role in project') 
@@ -576,8 +594,11 @@ def assignments(request, projectid):
       # Assign the role to the retrieved group
       try:
         conn.identity.assign_project_role_to_group(data['id'], group, role)
-      except:
+      except openstack.exceptions.SDKException:
         return HttpResponseBadRequest('Could not assign role to group')
+      invalidateProject(data['id'], rolefacets)
+      addProjectMemberships(data, [(ProjectMembership.GROUP, group.id,
+          group.name, domain.name, role.name)])
         
       # Return a status 200 OK
       return HttpResponse('Group got role in project.') 
@@ -590,63 +611,231 @@ def assignments(request, projectid):
     # Parse the supplied parameters (django does only parse GET and POST, not
     # DELETE).
     parameters = QueryDict(request.body)
-    usergroup, rolename = parameters.get('id').split(':')
+    try:
+      removal = parseRoleAssignmentID(parameters.get('id'))
+    except ValueError as e:
+      return HttpResponseBadRequest(str(e))
 
-    # Make sure that the user|group ID is in a valid format (ie: a hex-string).
-    if(not re.match(r'^[0-9a-f]+$', usergroup)):
-      return HttpResponseBadRequest('The supplied user/grop ID is invalid')
+    # Revoke the role. Whether the ID is a user or a group is looked up in the
+    # project's role-assignment index.
+    error = revokeOpenstackRoles(conn, data['id'], [removal])[0]
+    if error:
+      return HttpResponseBadRequest(error)
+    removeProjectMemberships(data['id'], [removal])
 
-    # Make sure the supplied rolename is a role allowed to be managed by
-    # cloudadmin.
-    if(rolename not in rolenames):
-      return HttpResponseBadRequest('The supplied role is invalid')
+    # Return a confirmation.
+    return HttpResponse('Role revoked from project.') 
 
-    # Retrieve the role in question from openstack.
-    try:
-      role = conn.identity.find_role(rolename)
-    except:
-      return HttpResponseBadRequest('Could not find role')
+  # If an unsupported method is used, return a 400 BadRequest.
+  else:
+    return HttpResponseBadRequest('Method %s not implemented' % request.method)
 
-    # Determine if the supplied ID is for a user or for a group by first trying
-    # to retrieve a user with that ID, if that fails try to retrieve a group
-    # with that ID. If both these steps fails, return an error.
-    roletype = None
-    try:
-      user = conn.identity.get_user(usergroup)
-      roletype = 'user'
-    except Exception as e:
-      try:
-        group = conn.identity.get_group(usergroup)
-        roletype = 'group'
-      except Exception as e:
-        return HttpResponseBadRequest('Could not find a user or a group with ' +
-            'the supplied ID')
-
-    # If a user should have the role revoked:
-    if(roletype == 'user'):
-      # Revoke the role
+@apiauth
+def assignmentsbulk(request, projectid):
+  """ API View - Adds roles for many users and groups in an openstack project
+
+  This view is a batch-variant of "cloudadmin.endpoints.openstack.assignments"
+  which lets a caller grant access to a whole class in a single request. The
+  view implemets the following requests:
+    POST:   Adds roles to a list of existing users and groups in an existing
+            openstack project. The view needs the following parameter, which
+            can be supplied multiple times:
+              entry:  A string describing a single role-assignment in the
+                      following format:
+                        <user|group>:<domain>:<name>:<rolename>
+            The access to the project is only verified once, and all the names
+            are resolved before the roles are assigned concurrently.
+    DELETE: Removes roles from a list of users and groups in the openstack
+            project. The view needs the following parameter, which can be
+            supplied multiple times:
+              id:     A string containing the ID of a user or a group, and the
+                      name of the role to be removed in the following format:
+                        <user_id|group_id>:<rolename>
+            The roles are revoked concurrently.
+  Both methods returns a JSON blob with the list 'results', containing a dict
+  per supplied entry with the keys 'entry', 'status' ('ok' or 'error') and
+  'message'.
+  """
+
+  if(request.method != 'POST' and request.method != 'DELETE'):
+    return HttpResponseBadRequest('Method %s not implemented' % request.method)
+
+  conn = getOpenstackConnection()
+
+  # Retrieve the openstack-project's current metadata, and make sure that the
+  # requesting user have access to it.
+  try:
+    data = getAndVerifyAccessToOpenstackProjectMeta(conn, projectid,
+        request.user, fresh=True)
+  except LookupError:
+    raise Http404
+
+  # Make sure the requesting user is allowed to change that openstack-project.
+  if not data['write']:
+    return HttpResponseForbidden('No write access to project')
+
+  # A DELETE request should revoke roles for users/groups in the project.
+  if(request.method == 'DELETE'):
+    # Parse the supplied parameters (django does only parse GET and POST, not
+    # DELETE).
+    ids = QueryDict(request.body).getlist('id')
+    if not ids:
+      return HttpResponseBadRequest('No IDs supplied')
+
+    results = []
+    removals = []
+    for entry in ids:
+      result = {'entry': entry, 'status': 'error', 'message': None}
+      results.append(result)
       try:
-        conn.identity.unassign_project_role_from_user(data['id'], user, role)
-      except Exception as e:
-        return HttpResponseBadRequest('Could not revoke %s for %s' % (rolename,
-            user.name))
+        removals.append((parseRoleAssignmentID(entry), result))
+      except ValueError as e:
+        result['message'] = str(e)
+
+    errors = revokeOpenstackRoles(conn, data['id'], [r[0] for r in removals])
+    removeProjectMemberships(data['id'], [r[0] for r, error in
+        zip(removals, errors) if not error])
+    for removal, error in zip(removals, errors):
+      if error:
+        removal[1]['message'] = error
+      else:
+        removal[1]['status'] = 'ok'
+        removal[1]['message'] = 'Role revoked from project'
+
+    return JsonResponse({'results': results})
+
+  entries = request.POST.getlist('entry')
+  if not entries:
+    return HttpResponseBadRequest('No entries supplied')
+
+  # Parse and sanitize every entry. Entries with errors get their result set
+  # right away, and are not considered further.
+  results = []
+  for entry in entries:
+    result = {'entry': entry, 'status': 'error', 'message': None}
+    results.append(result)
 
-      # Return a message to the user.
-      return HttpResponse('Users role revoked from project.') 
+    try:
+      ptype, domain_name, name, rolename = entry.split(':')
+    except ValueError:
+      result['message'] = 'The entry is not in the format ' + \
+          '<user|group>:<domain>:<name>:<rolename>'
+      continue
+
+    if(ptype != 'user' and ptype != 'group'):
+      result['message'] = 'Invalid type'
+    elif(rolename not in rolenames):
+      result['message'] = 'Invalid role'
+    elif(not re.match(r'^[a-zA-Z0-9]+$', domain_name) or
+        not re.match(r'^[a-zA-Z0-9_\-]+$', name)):
+      result['message'] = 'Domain or name was invalid'
+    else:
+      result['parsed'] = (ptype, domain_name, name, rolename)
 
-    # If it is not a user-id, it have to be a group-id.
+  parsed = [r for r in results if 'parsed' in r]
+
+  # Resolve all the roles and domains using one listing each.
+  try:
+    roles = getOpenstackRoles(conn, set(r['parsed'][3] for r in parsed))
+    domains = getOpenstackDomains(conn, set(r['parsed'][1] for r in parsed))
+  except openstack.exceptions.SDKException:
+    return HttpResponseBadRequest('Could not retrieve roles and domains ' +
+        'from openstack')
+
+  for result in parsed:
+    ptype, domain_name, name, rolename = result['parsed']
+    if(rolename not in roles):
+      result['message'] = 'Could not find role'
+    elif(domain_name not in domains):
+      result['message'] = 'Domain does not exist'
     else:
-      # Revoke the role
-      try:
-        conn.identity.unassign_project_role_from_group(data['id'], group, role)
-      except Exception as e:
-        return HttpResponseBadRequest('Could not revoke %s for %s' % (rolename,
-            group.name))
+      result['lookup'] = (ptype, name, domains[domain_name].id)
 
-      # Return a confirmation.
-      return HttpResponse('Groups role revoked from project.') 
+  # Look up all the distinct users and groups concurrently.
+  resolved = [r for r in parsed if 'lookup' in r]
+  principals = getOpenstackPrincipals(conn, [r['lookup'] for r in resolved])
 
-  # If an unsupported method is used, return a 400 BadRequest.
-  else:
+  assignments = []
+  for result in resolved:
+    principal = principals[result['lookup']]
+    if not principal:
+      result['message'] = 'Invalid %sname' % result['lookup'][0]
+    else:
+      assignments.append({
+        'type':      result['lookup'][0],
+        'principal': principal,
+        'role':      roles[result['parsed'][3]],
+        'domain':    domains[result['parsed'][1]].name,
+        'rolename':  result['parsed'][3],
+        'result':    result,
+      })
+
+  # Assign all the roles concurrently, and collect the outcome of each entry.
+  errors = assignOpenstackRoles(conn, data['id'], assignments)
+  invalidateProject(data['id'], rolefacets)
+  addProjectMemberships(data, [(a['type'], a['principal'].id,
+      a['principal'].name, a['domain'], a['rolename'])
+      for a, error in zip(assignments, errors) if not error])
+  for assignment, error in zip(assignments, errors):
+    if error:
+      assignment['result']['message'] = error
+    else:
+      assignment['result']['status'] = 'ok'
+      assignment['result']['message'] = '%s got role in project' % \
+          assignment['type'].capitalize()
+
+  for result in results:
+    result.pop('parsed', None)
+    result.pop('lookup', None)
+
+  return JsonResponse({'results': results})
+
+@apiauth
+def usage(request, projectid):
+  """ API View - Displays the usage-history of an openstack project
+
+  This view returns the stored usage-samples of an openstack project, together
+  with an estimate of when the project will run out of its quotas. The live
+  openstack API's are only used to verify the access to the project. The view
+  implements the following requests:
+    GET: Returns a JSON blob with the list 'samples' and the dict 'forecast'.
+         The following optional parameters are accepted:
+           resolution: Either 'raw', 'hourly' or 'daily'. Defaults to 'hourly'.
+           days:       An integer representing how many days of history
+                       should be returned. Defaults to 30, must be at least 1,
+                       and is limited to how long daily samples are kept.
+  """
+
+  if(request.method != 'GET'):
     return HttpResponseBadRequest('Method %s not implemented' % request.method)
 
+  conn = getOpenstackConnection()
+
+  # Make sure the requesting user have access to the openstack-project.
+  try:
+    data = getAndVerifyAccessToOpenstackProjectMeta(conn, projectid,
+        request.user)
+  except LookupError:
+    raise Http404
+
+  try:
+    resolution = UsageSample.RESOLUTIONS[request.GET.get('resolution',
+        'hourly')]
+  except KeyError:
+    return HttpResponseBadRequest('Invalid resolution')
+
+  try:
+    days = int(request.GET.get('days', 30))
+  except ValueError:
+    return HttpResponseBadRequest('Invalid number of days')
+  if(days < 1):
+    return HttpResponseBadRequest('Invalid number of days')
+  days = min(days, getRetention(UsageSample.DAILY))
+
+  samples = getUsageHistory(data['id'], resolution, 
+      timezone.now() - datetime.timedelta(days=days))
+
+  return JsonResponse({
+    'samples':  [sample.asDict() for sample in samples],
+    'forecast': forecastUsage(samples),
+  })
@@ -102,9 +102,9 @@ def index(request):
     project.save()
 
     # Add the supplied groups to the projects list of administrators.
-    for group in Group.objects.\
-        filter(id__in=request.POST.getlist('projectGroups')).all():
-      project.groups.add(group)
+    project.groups.add(*Group.objects.\
+        filter(id__in=request.POST.getlist('projectGroups')). \
+        values_list('id', flat=True))
 
     return HttpResponse('Project is created')
 
@@ -184,15 +184,20 @@ def single(request, id):
     # Save the project
     project.save()
     
+    # Determine which groups should be added to and removed from the project,
+    # by comparing the groups in the request with the current groups.
+    requested = set(Group.objects.\
+        filter(id__in=request.POST.getlist('projectGroups')). \
+        values_list('id', flat=True))
+    current = set(project.groups.values_list('id', flat=True))
+
     # Add groups in the request to the project.
-    for group in Group.objects.\
-        filter(id__in=request.POST.getlist('projectGroups')).all():
-      project.groups.add(group)
+    if(requested - current):
+      project.groups.add(*(requested - current))
 
     # Remove groups not listed in the request.
-    for group in Group.objects.\
-        exclude(id__in=request.POST.getlist('projectGroups')).all():
-      project.groups.remove(group)
+    if(current - requested):
+      project.groups.remove(*(current - requested))
 
     # Return a status OK and a message to the user.
     return HttpResponse('Project is updated') 
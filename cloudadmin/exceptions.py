@@ -17,3 +17,13 @@ class UsageTooHighException(Exception):
   """
 
   pass
+
+class BackendUnavailableException(Exception):
+  """ An Exception raised if a backend is unavailable
+
+  This Exception is raised if a backend (ie: an openstack API or the ceph
+  rgw's) can not be reached, or if its circuit-breaker is open because it have
+  recently failed repeatedly.
+  """
+
+  pass
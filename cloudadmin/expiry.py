@@ -0,0 +1,218 @@
+""" Utility methods to track the expiry of openstack projects
+
+This module contains the methods used by the expiry-scanner. The scanner reads
+the 'Expire' tag of all openstack projects using a single listing, and stores
+them in the ProjectExpiry table. From that table the administrators of
+projects which expire soon are notified, and expired projects are marked for
+deletion.
+"""
+
+import datetime
+import logging
+import re
+
+from configparser import NoOptionError, NoSectionError
+
+import openstack
+
+from django.contrib.auth.models import User
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.db.models import F
+from rgwadmin.exceptions import RGWAdminException
+
+from cloudadmin.exceptions import BackendUnavailableException
+from cloudadmin.models import Project, ProjectExpiry
+from cloudadmin.openstack import markOpenstackProjectDeletable
+from cloudadmin.settings import parser
+
+logger = logging.getLogger(__name__)
+
+def getExpirySetting(name, default):
+  """ Returns an integer from the expiry-section of the configuration-file """
+
+  try:
+    return parser.getint('expiry', name)
+  except (NoSectionError, NoOptionError, ValueError):
+    return default
+
+def parseExpiryTags(tags):
+  """ Extracts the expiry-related information from an openstack project's tags
+
+  Returns a dict with the keys 'expiry' (a date, or None), 'caproject' (the ID
+  of the cloudadmin project, or None) and 'deletable' (a boolean).
+  """
+
+  data = {'expiry': None, 'caproject': None, 'deletable': False}
+
+  for tag in tags:
+    m = re.match(r'^Expire=([0-9]{4})-([0-9]{2})-([0-9]{2})$', tag)
+    if m:
+      try:
+        data['expiry'] = datetime.date(*[int(g) for g in m.groups()])
+      except ValueError:
+        pass
+      continue
+
+    m = re.match(r'^CloudAdminProject=([0-9]+)$', tag)
+    if m:
+      data['caproject'] = int(m.group(1))
+    elif(tag == 'DELETABLE'):
+      data['deletable'] = True
+
+  return data
+
+def migrateLegacyExpiry(connection, dryrun = False):
+  """ Converts the old-style 'expiry' attribute of projects to 'Expire' tags
+
+  All projects are listed once, and projects without an 'Expire' tag, but with
+  an old-style expiry attribute (DD.MM.YYYY), gets the corresponding tag.
+
+  Returns a list of the names of the migrated projects.
+  """
+
+  migrated = []
+
+  for project in connection.list_projects():
+    if [t for t in project.tags if t.startswith('Expire=')]:
+      continue
+
+    try:
+      m = re.match(r'^([0-9]{2})\.([0-9]{2})\.([0-9]{4})$', project.expiry)
+    except (AttributeError, KeyError, TypeError):
+      m = None
+
+    if m:
+      if(not dryrun):
+        osproject = connection.identity.get_project(project.id)
+        osproject.add_tag(connection.identity, 'Expire=%s-%s-%s' %
+            (m.group(3), m.group(2), m.group(1)))
+      migrated.append(project.name)
+
+  return migrated
+
+def scanProjectExpiry(connection):
+  """ Updates the ProjectExpiry table from a single listing of all projects
+
+  New projects are added, changed projects are updated and projects which no
+  longer exists in openstack are removed from the table.
+
+  Returns the number of projects in the table.
+  """
+
+  existing = {e.project_id: e for e in ProjectExpiry.objects.all()}
+  caprojects = set(Project.objects.values_list('id', flat=True))
+  new = []
+  seen = set()
+
+  with transaction.atomic():
+    for project in connection.identity.projects():
+      seen.add(project.id)
+      data = parseExpiryTags(project.tags)
+      if(data['caproject'] not in caprojects):
+        data['caproject'] = None
+
+      entry = existing.get(project.id)
+      if not entry:
+        new.append(ProjectExpiry(project_id=project.id, name=project.name,
+            expiry=data['expiry'], caproject_id=data['caproject'],
+            deletable=data['deletable']))
+      elif(entry.name != project.name or entry.expiry != data['expiry'] or
+          entry.caproject_id != data['caproject'] or
+          entry.deletable != data['deletable']):
+        entry.name = project.name
+        entry.expiry = data['expiry']
+        entry.caproject_id = data['caproject']
+        entry.deletable = data['deletable']
+        entry.save()
+
+    ProjectExpiry.objects.bulk_create(new)
+    ProjectExpiry.objects.filter(
+        project_id__in=set(existing.keys()) - seen).delete()
+
+  return len(seen)
+
+def notifyExpiringProjects(dryrun = False):
+  """ Notifies the administrators of projects which expires soon
+
+  Projects expiring within the configured number of days ('notify_days' in the
+  expiry-section, default 14) are collected, and every administrator of the
+  cloudadmin projects they belong to gets a single e-mail listing all of their
+  expiring projects. The e-mails are sent in one batch, and each project is
+  only notified about once per expiry-date.
+
+  Returns the number of e-mails sent.
+  """
+
+  today = datetime.date.today()
+  limit = today + datetime.timedelta(days=getExpirySetting('notify_days', 14))
+
+  entries = [e for e in ProjectExpiry.objects.filter(deletable=False,
+      expiry__gte=today, expiry__lte=limit, caproject__isnull=False)
+      if e.notified_expiry != e.expiry]
+
+  # Retrieve the e-mail addresses of the administrators of all the relevant
+  # cloudadmin projects in one query.
+  administrators = {}
+  for email, caproject in User.objects.filter(
+      groups__project__in=set(e.caproject_id for e in entries)). \
+      exclude(email='').values_list('email', 'groups__project').distinct():
+    administrators.setdefault(caproject, set()).add(email)
+
+  # Collect the expiring projects per recipient.
+  recipients = {}
+  for entry in entries:
+    for email in administrators.get(entry.caproject_id, []):
+      recipients.setdefault(email, []).append(entry)
+
+  messages = []
+  for email, projects in recipients.items():
+    lines = ['  %s expires %s' % (e.name, e.expiry) for e in projects]
+    messages.append((
+      'Openstack projects expiring soon',
+      'The following openstack projects you administer will expire soon:\n\n' +
+        '\n'.join(lines) + '\n\nTo keep them, extend their expiry-date in ' +
+        'cloudadmin before they expire.\n',
+      None,
+      [email],
+    ))
+
+  if(not dryrun):
+    send_mass_mail(messages)
+    ProjectExpiry.objects.filter(pk__in=[e.pk for e in entries]). \
+        update(notified_expiry=F('expiry'))
+
+  return len(messages)
+
+def markExpiredProjects(connection, dryrun = False):
+  """ Marks projects which have been expired for a while as DELETABLE
+
+  Projects managed by cloudadmin which expired more than the configured number
+  of days ago ('grace_days' in the expiry-section, default 30) are marked for
+  deletion, just as if they were deleted through the API (see
+  markOpenstackProjectDeletable). A project which could not be marked is
+  logged and skipped, so that the other projects are still marked; it is
+  retried on the next run.
+
+  Returns a list of the names of the marked projects.
+  """
+
+  limit = datetime.date.today() - \
+      datetime.timedelta(days=getExpirySetting('grace_days', 30))
+  marked = []
+
+  for entry in ProjectExpiry.objects.filter(deletable=False,
+      caproject__isnull=False, expiry__lt=limit):
+    if(not dryrun):
+      try:
+        markOpenstackProjectDeletable(connection, entry.project_id)
+      except (openstack.exceptions.SDKException, RGWAdminException,
+          BackendUnavailableException, LookupError):
+        logger.exception('Could not mark project %s as deletable' %
+            entry.project_id)
+        continue
+      entry.deletable = True
+      entry.save(update_fields=['deletable'])
+    marked.append(entry.name)
+
+  return marked
@@ -1,48 +1,400 @@
+import hashlib
+import ldap3
+
+from configparser import NoOptionError
+
 from django.contrib.auth.models import User, Group
+from django.db import IntegrityError, transaction
+from ldap3.utils.conv import escape_filter_chars
 
 from django_python3_ldap.utils import format_search_filters
 
+from cloudadmin.metrics import instrumentLDAPConnection
+from cloudadmin.models import GroupIndex, LDAPGroup, LDAPMirrorState, \
+    LDAPSyncState, LDAPUser
+from cloudadmin.settings import parser
+from cloudadmin.settings import LDAP_AUTH_CONNECTION_PASSWORD
+from cloudadmin.settings import LDAP_AUTH_CONNECTION_USERNAME
+from cloudadmin.settings import LDAP_AUTH_CONNECT_TIMEOUT
 from cloudadmin.settings import LDAP_AUTH_GROUP_RELATIONS
 from cloudadmin.settings import LDAP_AUTH_GROUP_ATTRS
 from cloudadmin.settings import LDAP_AUTH_MEMBER_OF_ATTRIBUTE
-from cloudadmin.settings import LDAP_AUTH_GROUP_RELATIONS
+from cloudadmin.settings import LDAP_AUTH_RECEIVE_TIMEOUT
+from cloudadmin.settings import LDAP_AUTH_OBJECT_CLASS
+from cloudadmin.settings import LDAP_AUTH_URL
+from cloudadmin.settings import LDAP_AUTH_USE_TLS
+from cloudadmin.settings import LDAP_AUTH_USER_FIELDS
+from cloudadmin.utils import getCNFromDN
+
+def getSyncFingerprint(user, group_memberships):
+  """ Calculates a fingerprint of a user's state in LDAP
+
+  The fingerprint is a sha256-hash of the user's sorted group-memberships, and
+  the current values of the user-attributes derived from LDAP-groups (ie: the
+  superuser-flag).
+  """
+
+  elements = sorted(group_memberships)
+  for attr_name in sorted(LDAP_AUTH_GROUP_ATTRS.values()):
+    elements.append('%s=%s' % (attr_name, getattr(user, attr_name)))
+
+  return hashlib.sha256('\n'.join(elements).encode('utf-8')).hexdigest()
 
 def custom_sync_user_relations(user, ldap_attributes):
   """ Custom function to sync group-membershipt from LDAP
 
   This method lists which groups a user is member of in LDAP, and syncs them
   into the django-database. It updated a users relation every time the user logs
-  in.
+  in. The sync is set-based, so that only the memberships which have changed
+  are written to the database, and it is skipped entirely if the fingerprint
+  of the user's memberships is unchanged since the last sync.
   """
 
   # REtrieve a lit of groups
   group_memberships = frozenset(ldap_attributes[LDAP_AUTH_MEMBER_OF_ATTRIBUTE])
 
+  # If neither the groups nor the attributes derived from them have changed
+  # since the last login, there is nothing to sync.
+  if(LDAPSyncState.objects.filter(user=user, 
+      fingerprint=getSyncFingerprint(user, group_memberships)).exists()):
+    return
+
   # Sync user model boolean attrs. Currently it is the superuser attribute.
   # Staff attribute can also be relevant.
+  changed = []
   for group_id, attr_name in LDAP_AUTH_GROUP_ATTRS.items():
-    setattr(user, attr_name, group_id in group_memberships)
-  user.save()
-
-  # Make sure all the groups the user is in also exists in django 
-  o = list(group_memberships)
-  o.sort()
-  ingroups = []
-  for adname in o:
-    if Group.objects.filter(name=adname).count() == 0:
-      g = Group(name=adname)
-      g.save()
-    ingroups.append(adname)
-  
-  # Create a list of the groups which the user should not be in.
-  allgroupnames = [ \
-      value['name'] for value in \
-      Group.objects.filter(name__startswith = 'CN').values('name')
-  ]
-  notin = [name for name in allgroupnames if name not in ingroups]
+    if(getattr(user, attr_name) != (group_id in group_memberships)):
+      setattr(user, attr_name, group_id in group_memberships)
+      changed.append(attr_name)
+  if(changed):
+    user.save(update_fields=changed)
+
+  # Make sure all the groups the user is in also exists in django. The
+  # missing groups are found with a single query, and created in bulk.
+  existing = set(Group.objects.filter(name__in=group_memberships). \
+      values_list('name', flat=True))
+  missing = group_memberships - existing
+  if(missing):
+    try:
+      with transaction.atomic():
+        Group.objects.bulk_create([Group(name=name) for name in missing])
+    # If another login created some of the groups concurrently, fall back to
+    # creating them one by one.
+    except IntegrityError:
+      for name in missing:
+        Group.objects.get_or_create(name=name)
+
+    # Groups created in bulk are not seen by the signal maintaining the
+    # group-index, so they are indexed explicitly.
+    GroupIndex.indexGroups(Group.objects.filter(name__in=missing))
+
+  # Determine which group-memberships have changed since the last sync. Only
+  # the groups from LDAP (those starting with 'CN') are removed from the user.
+  current = set(user.groups.values_list('name', flat=True))
+  add = group_memberships - current
+  remove = set(name for name in current - group_memberships 
+      if name.startswith('CN'))
 
   # Sync user model groups.
-  user.groups.add(*Group.objects.filter(name__in=ingroups))
-  user.groups.remove(*Group.objects.filter(name__in=notin))
+  if(add):
+    user.groups.add(*Group.objects.filter(name__in=add). \
+        values_list('id', flat=True))
+  if(remove):
+    user.groups.remove(*Group.objects.filter(name__in=remove). \
+        values_list('id', flat=True))
+
+  # Store the fingerprint of the synced state.
+  LDAPSyncState.objects.update_or_create(user=user, 
+      defaults={'fingerprint': getSyncFingerprint(user, group_memberships)})
 
   return
+
+def getLDAPConnection(url = None):
+  """ Creates a connection to the LDAP directory, used by the LDAP-mirror.
+
+  The connection binds using the settings 'bind-user' and 'bind-password' in
+  the LDAP-section of the configuration-file, or anonymously if they are not
+  set. The URL of the LDAP server can be overridden, for instance to mirror
+  from a local test-server.
+  """
+
+  try:
+    user = parser.get('LDAP', 'bind-user')
+    password = parser.get('LDAP', 'bind-password')
+  except NoOptionError:
+    user = LDAP_AUTH_CONNECTION_USERNAME
+    password = LDAP_AUTH_CONNECTION_PASSWORD
+
+  if(LDAP_AUTH_USE_TLS):
+    bind = ldap3.AUTO_BIND_TLS_BEFORE_BIND
+  else:
+    bind = ldap3.AUTO_BIND_NO_TLS
+
+  server = ldap3.Server(url or LDAP_AUTH_URL,
+      connect_timeout=LDAP_AUTH_CONNECT_TIMEOUT)
+  return instrumentLDAPConnection(ldap3.Connection(server, user=user,
+      password=password, auto_bind=bind, read_only=True,
+      receive_timeout=LDAP_AUTH_RECEIVE_TIMEOUT))
+
+def getLDAPValues(entry, attribute):
+  """ Returns the values of an attribute in a search-result as strings """
+
+  return [value.decode('utf-8') for value in 
+      entry['raw_attributes'].get(attribute, [])]
+
+def getLDAPValue(entry, attribute):
+  """ Returns the first value of an attribute in a search-result as a string
+  
+  An empty string is returned if the attribute is not present.
+  """
+
+  values = getLDAPValues(entry, attribute)
+  if values:
+    return values[0]
+  return ''
+
+def getRangedLDAPAttribute(entry, attribute):
+  """ Returns the name of a ranged attribute (ie: 'member;range=0-1499') in a
+  search-result, and the last index of the range ('*' for the last range).
+
+  Returns (None, None) if the attribute is not returned in ranges.
+  """
+
+  prefix = '%s;range=' % attribute.lower()
+  for name in entry['raw_attributes']:
+    if(name.lower().startswith(prefix)):
+      return name, name.rpartition('-')[2]
+  return None, None
+
+def getLDAPMemberValues(connection, entry, attribute):
+  """ Returns all the values of a multi-valued attribute of a group
+
+  Active Directory returns large attributes (ie: the member attribute of
+  groups with more than MaxValRange members) in ranges. The remaining ranges
+  are retrieved with a search for the group itself per range, until the last
+  range is returned. Returns None if a range could not be retrieved, so that
+  the caller can tell an incomplete list from an empty one.
+  """
+
+  name, last = getRangedLDAPAttribute(entry, attribute)
+  if(name is None):
+    return getLDAPValues(entry, attribute)
+
+  values = getLDAPValues(entry, name)
+  while(last != '*'):
+    try:
+      start = int(last) + 1
+    except ValueError:
+      return None
+
+    connection.search(entry['dn'], '(objectClass=*)',
+        search_scope=ldap3.BASE,
+        attributes=['%s;range=%d-*' % (attribute, start)])
+    results = [e for e in connection.response or []
+        if e.get('type') == 'searchResEntry']
+    if(not results):
+      return None
+
+    name, last = getRangedLDAPAttribute(results[0], attribute)
+    if(name is None):
+      return None
+    values += getLDAPValues(results[0], name)
+
+  return values
+
+def chunks(iterable, size):
+  """ Splits an iterable in lists of the supplied size """
+
+  chunk = []
+  for element in iterable:
+    chunk.append(element)
+    if(len(chunk) >= size):
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+def highwaterKey(value):
+  """ Returns a key used to compare values of the sync-attribute.
+
+  uSNChanged is a number, while modifyTimestamp is a generalized time which
+  can be compared as a string.
+  """
+
+  if(value.isdigit()):
+    return (len(value), value)
+  return (0, value)
+
+def searchLDAPMirror(connection, base, objectclass, syncattr, attributes,
+    full, pagesize):
+  """ Performs a paged search for the entries to mirror from a search-base
+
+  Unless a full sync is requested, only the entries where the sync-attribute
+  is at least as high as the highwater stored for the search-base is returned.
+  Returns a tuple with the mirror-state of the search-base, and a generator
+  returning the entries.
+  """
+
+  # The state is tracked per object-class, as users and groups could be
+  # mirrored from the same search-base.
+  state, created = LDAPMirrorState.objects.get_or_create(
+      base='%s:%s' % (objectclass, base))
+
+  search = '(objectClass=%s)' % escape_filter_chars(objectclass)
+  if(state.highwater and not full):
+    search = '(&%s(%s>=%s))' % (search, syncattr, 
+        escape_filter_chars(state.highwater))
+
+  entries = connection.extend.standard.paged_search(base, search,
+      attributes=attributes + [syncattr], paged_size=pagesize, generator=True)
+
+  return state, (e for e in entries if e.get('type') == 'searchResEntry')
+
+def mirrorLDAPGroups(connection, base, objectclass = 'group',
+    syncattr = 'uSNChanged', full = False, pagesize = 500,
+    memberattr = 'member'):
+  """ Mirrors the groups under a search-base into the LDAPGroup table
+
+  The groups are retrieved using a paged search, and are written to the
+  database in batches. A full sync also removes the mirrored groups which are
+  no longer present in LDAP.
+
+  The memberships of the retrieved groups are replaced with their members (from
+  the member attribute) which are already mirrored. In AD, memberOf is a
+  back-link, so adding a user to a group only changes the sync-attribute of
+  the group; the group-sync is thus what picks up membership changes of users
+  which are otherwise unchanged. Members of large groups are retrieved in
+  ranges (see getLDAPMemberValues); the memberships of a group whose members
+  could not all be retrieved are left as they are.
+
+  Returns the number of groups updated.
+  """
+
+  state, entries = searchLDAPMirror(connection, base, objectclass, syncattr,
+      ['cn', memberattr], full, pagesize)
+  highwater = state.highwater
+  seen = set()
+  through = LDAPUser.groups.through
+
+  for chunk in chunks(entries, pagesize):
+    groups = {}
+    members = {}
+    for entry in chunk:
+      groups[entry['dn']] = LDAPGroup(dn=entry['dn'], 
+          cn=getLDAPValue(entry, 'cn') or getCNFromDN(entry['dn']),
+          changed=getLDAPValue(entry, syncattr))
+      values = getLDAPMemberValues(connection, entry, memberattr)
+      if(values is not None):
+        members[entry['dn']] = set(values)
+      highwater = max(highwater, groups[entry['dn']].changed, key=highwaterKey)
+
+    with transaction.atomic():
+      for group in LDAPGroup.objects.filter(dn__in=groups.keys()):
+        new = groups.pop(group.dn)
+        group.cn = new.cn
+        group.changed = new.changed
+        group.save()
+        seen.add(group.dn)
+      LDAPGroup.objects.bulk_create(groups.values())
+      seen.update(groups.keys())
+
+      # Replace the memberships of the groups in this batch. Members which are
+      # not mirrored yet gets their memberships when they are.
+      groupids = dict(LDAPGroup.objects.filter(dn__in=members.keys()).
+          values_list('dn', 'id'))
+      userids = dict(LDAPUser.objects.filter(
+          dn__in=set().union(*members.values())).values_list('dn', 'id'))
+      through.objects.filter(ldapgroup_id__in=groupids.values()).delete()
+      through.objects.bulk_create([
+        through(ldapuser_id=userids[user], ldapgroup_id=groupids[dn])
+        for dn, users in members.items() for user in users if user in userids
+      ])
+
+  if(full):
+    stale = set(LDAPGroup.objects.values_list('dn', flat=True)) - seen
+    stale = [dn for dn in stale if dn.lower().endswith(base.lower())]
+    for chunk in chunks(stale, pagesize):
+      LDAPGroup.objects.filter(dn__in=chunk).delete()
+
+  state.highwater = highwater
+  state.save()
+  return len(seen)
+
+def mirrorLDAPUsers(connection, base, objectclass = LDAP_AUTH_OBJECT_CLASS,
+    syncattr = 'uSNChanged', full = False, pagesize = 500):
+  """ Mirrors the users under a search-base into the LDAPUser table
+
+  The users are retrieved with a paged search, together with their
+  group-memberships (from the memberOf attribute). Groups referenced by a user
+  which is not mirrored yet are created. As memberOf does not change the
+  sync-attribute of the user, membership-changes of unchanged users are
+  mirrored by mirrorLDAPGroups. A full sync also removes the mirrored
+  users which are no longer present in LDAP.
+
+  Returns the number of users updated.
+  """
+
+  fields = LDAP_AUTH_USER_FIELDS
+  state, entries = searchLDAPMirror(connection, base, objectclass, syncattr,
+      list(fields.values()) + [LDAP_AUTH_MEMBER_OF_ATTRIBUTE], full, pagesize)
+  highwater = state.highwater
+  seen = set()
+  through = LDAPUser.groups.through
+
+  for chunk in chunks(entries, pagesize):
+    users = {}
+    memberships = {}
+    for entry in chunk:
+      users[entry['dn']] = LDAPUser(dn=entry['dn'], 
+          changed=getLDAPValue(entry, syncattr), **{
+            field: getLDAPValue(entry, attribute) 
+            for field, attribute in fields.items()})
+      memberships[entry['dn']] = set(getLDAPValues(entry, 
+          LDAP_AUTH_MEMBER_OF_ATTRIBUTE))
+      highwater = max(highwater, users[entry['dn']].changed, key=highwaterKey)
+
+    with transaction.atomic():
+      # Update the existing users, and create the new ones.
+      for user in LDAPUser.objects.filter(dn__in=users.keys()):
+        new = users.pop(user.dn)
+        new.id = user.id
+        new.save()
+        seen.add(user.dn)
+      LDAPUser.objects.bulk_create(users.values())
+      seen.update(users.keys())
+      userids = dict(LDAPUser.objects.filter(dn__in=memberships.keys()).
+          values_list('dn', 'id'))
+
+      # Make sure all the referenced groups exists.
+      dns = set().union(*memberships.values())
+      groupids = dict(LDAPGroup.objects.filter(dn__in=dns).
+          values_list('dn', 'id'))
+      LDAPGroup.objects.bulk_create([LDAPGroup(dn=dn, cn=getCNFromDN(dn))
+          for dn in dns - set(groupids.keys())])
+      groupids = dict(LDAPGroup.objects.filter(dn__in=dns).
+          values_list('dn', 'id'))
+
+      # Replace the memberships of the users in this batch.
+      through.objects.filter(ldapuser_id__in=userids.values()).delete()
+      through.objects.bulk_create([
+        through(ldapuser_id=userids[dn], ldapgroup_id=groupids[group])
+        for dn, groups in memberships.items() for group in groups
+      ])
+
+  if(full):
+    stale = set(LDAPUser.objects.values_list('dn', flat=True)) - seen
+    stale = [dn for dn in stale if dn.lower().endswith(base.lower())]
+    for chunk in chunks(stale, pagesize):
+      LDAPUser.objects.filter(dn__in=chunk).delete()
+
+  state.highwater = highwater
+  state.save()
+  return len(seen)
+
+def getMirroredGroups(username):
+  """ Returns the DN's of the groups a user is member of, according to the
+  LDAP-mirror.
+  """
+
+  return list(LDAPGroup.objects.filter(ldapuser__username=username).
+      values_list('dn', flat=True))
@@ -0,0 +1,76 @@
+import threading
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cloudadmin.benchmark import StubServer, buildFixtures, \
+    configureForStub, createDatabaseFixtures, getScenarios, runScenario
+
+class Command(BaseCommand):
+  help = 'Benchmarks the openstack-related views against a local stub of ' + \
+      'the openstack and ceph API\'s. Runs in a separate test-database.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--projects', default='10,100,1000',
+        help='Comma-separated numbers of openstack projects to benchmark ' +
+        'with (default: 10,100,1000)')
+    parser.add_argument('--members', default='10,300',
+        help='Comma-separated numbers of users/groups in each project ' +
+        '(default: 10,300)')
+    parser.add_argument('--latency', type=float, default=5,
+        help='Milliseconds the stub waits before answering each call ' +
+        '(default: 5)')
+    parser.add_argument('--iterations', type=int, default=5,
+        help='Number of times to run each scenario (default: 5)')
+    parser.add_argument('--warm', action='store_true',
+        help='Do not clear the cache between the iterations')
+
+  def handle(self, *args, **options):
+    # The cache is cleared between the iterations, which should not happen to
+    # a cache shared with the running application.
+    if(not options['warm'] and
+        not settings.CACHES['default']['BACKEND'].endswith('LocMemCache')):
+      raise CommandError('The benchmark clears the cache; use the locmem ' +
+          'cache-backend, or --warm')
+
+    scales = [(int(p), int(m)) for p in options['projects'].split(',')
+        for m in options['members'].split(',')]
+
+    testdb = connection.creation.create_test_db(verbosity=0,
+        autoclobber=True)
+    self.stdout.write('Using the test-database %s' % testdb)
+
+    try:
+      for projects, members in scales:
+        self.benchmark(projects, members, options)
+    finally:
+      connection.creation.destroy_test_db(testdb, verbosity=0)
+
+  def benchmark(self, projects, members, options):
+    stub = StubServer(buildFixtures(projects, members),
+        options['latency'] / 1000)
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+      configureForStub(stub)
+      user, ldap_attributes = createDatabaseFixtures(members)
+
+      self.stdout.write('\n%d projects, %d members, %.1fms latency:' %
+          (projects, members, options['latency']))
+      self.stdout.write('  %-45s %9s %9s %8s  %s' %
+          ('Scenario', 'Median ms', 'Max ms', 'Queries', 'Backend calls'))
+
+      for name, function in getScenarios(stub, user, ldap_attributes):
+        result = runScenario(stub, function, options['iterations'],
+            options['warm'])
+        calls = ', '.join('%s=%g' % (s, c) for s, c in
+            sorted(result['calls'].items()))
+        self.stdout.write('  %-45s %9.1f %9.1f %8g  %s' % (name,
+            result['median_ms'], result['max_ms'], result['queries'], calls))
+    finally:
+      stub.shutdown()
+      stub.server_close()
+      call_command('flush', interactive=False, verbosity=0)
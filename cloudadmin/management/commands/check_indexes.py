@@ -0,0 +1,107 @@
+import re
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from cloudadmin.models import GroupIndex, LDAPSyncState, Project, \
+    ProjectExpiry, ProjectMembership, QuotaTemplate, Token, UsageSample
+
+def getChecks():
+  """ Returns the hot queries of cloudadmin, and the tables which must be
+  accessed through an index when running them.
+  """
+
+  now = timezone.now()
+
+  return [
+    ('Token lookup by hash', Token.objects.filter(value_hash='x'),
+        ['cloudadmin_token']),
+    ('Expired tokens', Token.objects.filter(expiry__lt=now),
+        ['cloudadmin_token']),
+    ('Project by name', Project.objects.filter(name='x'),
+        ['cloudadmin_project']),
+    ('Groups by name in the LDAP sync',
+        Group.objects.filter(name__in=['CN=x,DC=y', 'CN=z,DC=y']),
+        ['auth_group']),
+    ('Group search by prefix',
+        GroupIndex.objects.filter(cn__gte='x', cn__lt='x\uffff'),
+        ['cloudadmin_groupindex']),
+    ('Quota-templates of a project',
+        QuotaTemplate.objects.filter(project_id=1, default=True),
+        ['cloudadmin_quotatemplate']),
+    ('Quota-templates available to a user',
+        QuotaTemplate.objects.filter(Q(project=None) |
+        Q(project__groups__user=1)),
+        ['cloudadmin_project_groups', 'auth_user_groups']),
+    ('LDAP sync-state of a user',
+        LDAPSyncState.objects.filter(user_id=1, fingerprint='x'),
+        ['cloudadmin_ldapsyncstate']),
+    ('Usage-history of a project',
+        UsageSample.objects.filter(project_id='x', resolution=UsageSample.RAW,
+        timestamp__gte=now), ['cloudadmin_usagesample']),
+    ('Projects expiring soon', ProjectExpiry.objects.filter(expiry__lt=now),
+        ['cloudadmin_projectexpiry']),
+    ('Projects of a user or group',
+        ProjectMembership.objects.filter(principal_type='user', name='x'),
+        ['cloudadmin_projectmembership']),
+  ]
+
+def explain(queryset):
+  """ Runs EXPLAIN for a queryset, and determines how each table is accessed.
+
+  Returns a dict mapping each table in the query-plan to a tuple (indexed,
+  description), where indexed is True if the table is accessed through an
+  index. Only SQLite and MySQL are supported.
+  """
+
+  sql, params = queryset.query.sql_with_params()
+  tables = {}
+
+  with connection.cursor() as cursor:
+    if(connection.vendor == 'sqlite'):
+      cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+      for row in cursor.fetchall():
+        detail = row[-1]
+        m = re.match(r'^(SCAN|SEARCH)( TABLE)? (\w+)', detail)
+        if m:
+          tables[m.group(3)] = (m.group(1) == 'SEARCH', detail)
+
+    elif(connection.vendor == 'mysql'):
+      cursor.execute('EXPLAIN %s' % sql, params)
+      columns = [c[0] for c in cursor.description]
+      for row in cursor.fetchall():
+        row = dict(zip(columns, row))
+        if(row['table']):
+          tables[row['table']] = (bool(row['key']) and
+              row['type'] not in ['ALL', 'index'],
+              'type=%s key=%s' % (row['type'], row['key']))
+
+    else:
+      raise CommandError('EXPLAIN is only supported on SQLite and MySQL')
+
+  return tables
+
+class Command(BaseCommand):
+  help = 'Verifies, using EXPLAIN, that the hot queries of cloudadmin use ' + \
+      'indexes. Run it against a database with realistic data, as the ' + \
+      'query-planner might prefer a full scan of (almost) empty tables.'
+
+  def handle(self, *args, **options):
+    failed = []
+
+    for name, queryset, indexed in getChecks():
+      plan = explain(queryset)
+
+      for table in indexed:
+        usesindex, detail = plan.get(table, (False, 'not in query-plan'))
+        self.stdout.write('%-4s %-40s %-28s %s' % ('OK' if usesindex
+            else 'FAIL', name, table, detail))
+        if(not usesindex):
+          failed.append('%s (%s)' % (name, table))
+
+    if(failed):
+      raise CommandError('The following queries does not use an index: %s' %
+          ', '.join(failed))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from cloudadmin.openstack import getOpenstackConnection
+from cloudadmin.usage import collectUsageSamples, downsampleUsageSamples
+
+class Command(BaseCommand):
+  help = 'Samples the usage of all openstack projects, and downsamples old ' + \
+      'samples. Intended to be run from cron every few minutes.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--no-downsample', action='store_true',
+        help='Only collect new samples')
+
+  def handle(self, *args, **options):
+    c = getOpenstackConnection()
+
+    count = collectUsageSamples(c)
+    self.stdout.write('Stored %d usage samples' % count)
+
+    if(not options['no_downsample']):
+      downsampleUsageSamples()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from cloudadmin.memberships import indexProjectMemberships
+from cloudadmin.openstack import getOpenstackConnection
+
+class Command(BaseCommand):
+  help = 'Rebuilds the index of which projects the users and groups have ' + \
+      'roles in, from bulk listings of the openstack role-assignments. ' + \
+      'Intended to be run from cron, as changes made outside of ' + \
+      'cloudadmin are only seen by this command.'
+
+  def handle(self, *args, **options):
+    c = getOpenstackConnection()
+
+    count = indexProjectMemberships(c)
+    self.stdout.write('Indexed %d project memberships' % count)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from cloudadmin.ldap import getLDAPConnection, mirrorLDAPGroups, \
+    mirrorLDAPUsers
+from cloudadmin.settings import LDAP_AUTH_OBJECT_CLASS, LDAP_AUTH_SEARCH_BASE
+from cloudadmin.settings import parser as config
+
+class Command(BaseCommand):
+  help = 'Mirrors the users and groups in the LDAP directory into the ' + \
+      'local database. Only entries changed since the last run is ' + \
+      'retrieved, unless --full is given.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--url', 
+        help='Mirror from this LDAP server instead of the configured one')
+    parser.add_argument('--full', action='store_true',
+        help='Mirror all entries, and remove entries deleted from LDAP')
+    parser.add_argument('--sync-attribute', default='uSNChanged',
+        help='The attribute used for incremental syncs. Use ' + 
+            'modifyTimestamp for OpenLDAP (default: uSNChanged)')
+    parser.add_argument('--group-class', default='group',
+        help='The objectClass of groups. Use groupOfNames for OpenLDAP ' + 
+            '(default: group)')
+    parser.add_argument('--user-class', default=LDAP_AUTH_OBJECT_CLASS,
+        help='The objectClass of users (default: %s)' % LDAP_AUTH_OBJECT_CLASS)
+    parser.add_argument('--page-size', type=int, default=500,
+        help='The number of entries retrieved per page (default: 500)')
+
+  def handle(self, *args, **options):
+    c = getLDAPConnection(options['url'])
+
+    count = mirrorLDAPGroups(c, config.get('LDAP', 'group-base'),
+        objectclass = options['group_class'],
+        syncattr = options['sync_attribute'],
+        full = options['full'], pagesize = options['page_size'])
+    self.stdout.write('Mirrored %d groups' % count)
+
+    count = mirrorLDAPUsers(c, LDAP_AUTH_SEARCH_BASE,
+        objectclass = options['user_class'],
+        syncattr = options['sync_attribute'],
+        full = options['full'], pagesize = options['page_size'])
+    self.stdout.write('Mirrored %d users' % count)
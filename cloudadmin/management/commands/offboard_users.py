@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cloudadmin.memberships import offboardUsers
+from cloudadmin.openstack import getOpenstackConnection, getOpenstackDomains
+
+class Command(BaseCommand):
+  help = 'Revokes all the roles a list of departed users have in the ' + \
+      'openstack projects. Run it with --dry-run first to see which roles ' + \
+      'would be revoked.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('usernames', nargs='*',
+        help='The usernames of the users to offboard')
+    parser.add_argument('--file',
+        help='Read the usernames from a file, one per line')
+    parser.add_argument('--domain', required=True,
+        help='The name or ID of the openstack domain of the users')
+    parser.add_argument('--dry-run', action='store_true',
+        help='Only report which roles would be revoked')
+
+  def handle(self, *args, **options):
+    usernames = list(options['usernames'])
+    if(options['file']):
+      with open(options['file']) as f:
+        usernames += [line.strip() for line in f if line.strip()]
+    if(not usernames):
+      raise CommandError('No usernames supplied')
+
+    c = getOpenstackConnection()
+    domain = getOpenstackDomains(c, [options['domain']]).get(options['domain'])
+    if(not domain):
+      raise CommandError('Could not find the domain %s' % options['domain'])
+
+    results = offboardUsers(c, usernames, domain.id, options['dry_run'])
+    for result in results:
+      self.stdout.write('%-7s %-20s %-40s %-20s %s' % (result['status'],
+          result['username'], result['project_name'] or '-',
+          result['role'] or '-', result['message'] or ''))
+
+    errors = len([r for r in results if r['status'] == 'error'])
+    self.stdout.write('%d roles for %d users, %d errors' % (
+        len([r for r in results if r['role']]), len(set(usernames)), errors))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cloudadmin.models import Token
+
+class Command(BaseCommand):
+  help = 'Deletes all expired API tokens'
+
+  def handle(self, *args, **options):
+    expired = Token.objects.filter(expiry__lt=timezone.now())
+    count = expired.count()
+    expired.delete()
+    self.stdout.write('Deleted %d expired tokens' % count)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from cloudadmin.expiry import markExpiredProjects, migrateLegacyExpiry, \
+    notifyExpiringProjects, scanProjectExpiry
+from cloudadmin.openstack import getOpenstackConnection
+
+class Command(BaseCommand):
+  help = 'Scans the expiry-dates of all openstack projects, notifies the ' + \
+      'administrators of projects expiring soon and marks expired projects ' + \
+      'for deletion. Intended to be run from cron once a day.'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--migrate-legacy', action='store_true',
+        help='Convert old-style expiry attributes to Expire tags first')
+    parser.add_argument('--dry-run', action='store_true',
+        help='Only report what would be done')
+    parser.add_argument('--no-notify', action='store_true',
+        help='Do not send notifications')
+    parser.add_argument('--no-mark', action='store_true',
+        help='Do not mark expired projects for deletion')
+
+  def handle(self, *args, **options):
+    c = getOpenstackConnection()
+    dryrun = options['dry_run']
+
+    if(options['migrate_legacy']):
+      for name in migrateLegacyExpiry(c, dryrun):
+        self.stdout.write('Migrated the legacy expiry of %s' % name)
+
+    count = scanProjectExpiry(c)
+    self.stdout.write('Scanned %d projects' % count)
+
+    if(not options['no_notify']):
+      count = notifyExpiringProjects(dryrun)
+      self.stdout.write('Sent %d notifications' % count)
+
+    if(not options['no_mark']):
+      for name in markExpiredProjects(c, dryrun):
+        self.stdout.write('Marked %s for deletion' % name)
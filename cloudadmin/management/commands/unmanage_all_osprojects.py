@@ -18,8 +18,10 @@ class Command(BaseCommand):
           try:
             caproject = Project.objects.get(pk=int(m.group(1)))
             osproject = getOpenstackProject(c, project.id)
+            quota = osproject['quota']
+            quota.update(quota['regions'][quota['region']])
             osuse = QuotaInformation()
-            osuse.fromDict(osproject['quota'])
+            osuse.fromDict(quota)
             caproject.removeUsage(osuse)
           except:
             pass
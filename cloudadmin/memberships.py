@@ -0,0 +1,283 @@
+""" Utility methods to maintain a reverse index of openstack role-assignments
+
+This module contains the methods maintaining the ProjectMembership table,
+which lists the roles every user and group have in the openstack projects. The
+table is rebuilt from bulk listings of the role-assignments, users and groups
+by the command 'index_memberships', and the rows of the roles cloudadmin
+assigns or revokes are updated as it changes them. It lets cloudadmin answer
+which projects a user or a group have access to without querying every
+project. Roles changed outside of cloudadmin are only picked up by the
+command, which should therefore be run regularly (ie: hourly from cron).
+
+The module also contains the offboarding-sweep, which revokes all the roles a
+list of departed users have in the openstack projects.
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import openstack
+
+from django.db import DatabaseError, transaction
+
+from cloudadmin.cache import invalidateProject
+from cloudadmin.models import LDAPUser, ProjectMembership
+from cloudadmin.openstack import getOpenstackWorkers, rolefacets
+
+logger = logging.getLogger(__name__)
+
+def getOpenstackPrincipalsByID(connection, ptype, ids):
+  """ Retrieves multiple users or groups from openstack by their ID
+  concurrently.
+
+  Returns a dict mapping each ID to the user/group object. IDs which are not
+  found in openstack are left out of the dict.
+  """
+
+  def lookup(principal_id):
+    try:
+      if(ptype == ProjectMembership.USER):
+        return connection.identity.get_user(principal_id)
+      else:
+        return connection.identity.get_group(principal_id)
+    except openstack.exceptions.ResourceNotFound:
+      return None
+
+  ids = list(ids)
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    results = executor.map(lookup, ids)
+
+  return {i: r for i, r in zip(ids, results) if r is not None}
+
+def indexProjectMemberships(connection):
+  """ Rebuilds the ProjectMembership table from bulk listings
+
+  All role-assignments in openstack are retrieved in a single listing, and the
+  names of the projects, roles, domains, users and groups are resolved using a
+  single listing of each. Users and groups missing from the listings (ie: if
+  the identity-backend limits the size of listings) are looked up one by one.
+  Role-assignments which are not scoped to a project are skipped.
+
+  Returns the number of memberships in the table.
+  """
+
+  projects = {p.id: p.name for p in connection.identity.projects()}
+  roles = {r.id: r.name for r in connection.identity.roles()}
+  domains = {d.id: d.name for d in connection.identity.domains()}
+  principals = {
+    ProjectMembership.USER:  {u.id: u for u in connection.identity.users()},
+    ProjectMembership.GROUP: {g.id: g for g in connection.identity.groups()},
+  }
+
+  assignments = []
+  for ra in connection.identity.role_assignments():
+    project = (ra.scope or {}).get('project')
+    if(not project or project['id'] not in projects):
+      continue
+
+    if(ra.user):
+      assignments.append((project['id'], ProjectMembership.USER,
+          ra.user['id'], ra.role['id']))
+    elif(ra.group):
+      assignments.append((project['id'], ProjectMembership.GROUP,
+          ra.group['id'], ra.role['id']))
+
+  # Look up the users and groups which were not in the listings.
+  for ptype in principals:
+    missing = set([a[2] for a in assignments if a[1] == ptype]) - \
+        set(principals[ptype].keys())
+    if(missing):
+      principals[ptype].update(
+          getOpenstackPrincipalsByID(connection, ptype, missing))
+
+  memberships = []
+  for project_id, ptype, principal_id, role_id in assignments:
+    principal = principals[ptype].get(principal_id)
+    if(not principal):
+      continue
+
+    memberships.append(ProjectMembership(
+      project_id     = project_id,
+      project_name   = projects[project_id],
+      principal_type = ptype,
+      principal_id   = principal_id,
+      name           = principal.name.lower(),
+      domain         = domains.get(principal.domain_id, principal.domain_id),
+      role           = roles.get(role_id, role_id),
+    ))
+
+  with transaction.atomic():
+    ProjectMembership.objects.all().delete()
+    ProjectMembership.objects.bulk_create(memberships, batch_size=500)
+
+  return len(memberships)
+
+def addProjectMemberships(osproject, memberships):
+  """ Adds roles which are assigned in an openstack project to the
+  ProjectMembership table
+
+  The project is supplied as its metadata (see getOpenstackProjectMeta), and
+  the roles as a list of (principal_type, principal_id, name, domain, role)
+  tuples, which the caller already knows from assigning them. Roles already in
+  the table are not added twice.
+
+  The roles are already assigned in openstack when this is called, so errors
+  are logged rather than raised; the table is corrected by the next run of
+  'index_memberships'.
+  """
+
+  try:
+    with transaction.atomic():
+      for ptype, principal_id, name, domain, role in memberships:
+        ProjectMembership.objects.get_or_create(
+          project_id   = osproject['id'],
+          principal_id = principal_id,
+          role         = role,
+          defaults     = {
+            'project_name':   osproject['fullname'],
+            'principal_type': ptype,
+            'name':           name.lower(),
+            'domain':         domain,
+          },
+        )
+  except DatabaseError:
+    logger.exception('Could not add the memberships of project %s' %
+        osproject['id'])
+
+def removeProjectMemberships(project_id, removals):
+  """ Removes roles which are revoked in an openstack project from the
+  ProjectMembership table
+
+  The roles are supplied as a list of (principal_id, role) tuples. Errors are
+  logged rather than raised, just as for addProjectMemberships.
+  """
+
+  try:
+    with transaction.atomic():
+      for principal_id, role in removals:
+        ProjectMembership.objects.filter(project_id=project_id,
+            principal_id=principal_id, role=role).delete()
+  except DatabaseError:
+    logger.exception('Could not remove the memberships of project %s' %
+        project_id)
+
+def getUserGroupNames(username):
+  """ Returns the (lower-case) names of the groups a user is a member of,
+  according to the LDAP-mirror. """
+
+  return [cn.lower() for cn in LDAPUser.objects.filter(
+      username__iexact=username).values_list('groups__cn', flat=True) if cn]
+
+def getOpenstackUserAssignments(connection, username, domain_id):
+  """ Retrieves the project-roles of a user using a single filtered listing
+
+  Returns a tuple (user, assignments), where assignments is a list of
+  (project_id, role_id) tuples. The user is None (and the list empty) if the
+  user does not exist in the domain. Roles not scoped to a project are left
+  out. Raises an openstack SDKException if the user or the role-assignments
+  could not be retrieved, so that a failing lookup is not mistaken for a
+  missing user.
+  """
+
+  user = None
+  for u in connection.list_users(domain_id=domain_id, name=username):
+    if(u.name == username):
+      user = u
+
+  if not user:
+    return (None, [])
+
+  assignments = []
+  for ra in connection.identity.role_assignments(user_id=user.id):
+    project = (ra.scope or {}).get('project')
+    if(project):
+      assignments.append((project['id'], ra.role['id']))
+
+  return (user, assignments)
+
+def offboardUsers(connection, usernames, domain_id, dryrun = False):
+  """ Revokes all the roles a list of users have in the openstack projects
+
+  The roles of each user are found using a single filtered listing of the
+  role-assignments, and the listings and the revocations are performed
+  concurrently. Roles the users have through their groups are not touched, as
+  the group-memberships are managed in LDAP. The caches and the
+  ProjectMembership table are updated for the projects which are changed.
+
+  Returns a list with a dict per role (and per user which could not be found
+  or looked up) with the keys 'username', 'project_id', 'project_name',
+  'role', 'status' ('revoked', 'dryrun' or 'error') and 'message'.
+  """
+
+  usernames = sorted(set(usernames))
+  projects = {p.id: p.name for p in connection.identity.projects()}
+  roles = {r.id: r.name for r in connection.identity.roles()}
+
+  def lookup(username):
+    try:
+      return getOpenstackUserAssignments(connection, username, domain_id)
+    except openstack.exceptions.SDKException:
+      return None
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    found = list(executor.map(lookup, usernames))
+
+  results = []
+  revocations = []
+  for username, lookedup in zip(usernames, found):
+    user, assignments = lookedup or (None, [])
+    if not user:
+      results.append({'username': username, 'project_id': None,
+          'project_name': None, 'role': None, 'status': 'error',
+          'message': 'Could not look up the user' if lookedup is None else
+          'Could not find the user'})
+      continue
+
+    for project_id, role_id in assignments:
+      result = {
+        'username':     username,
+        'project_id':   project_id,
+        'project_name': projects.get(project_id, project_id),
+        'role':         roles.get(role_id, role_id),
+        'status':       'dryrun' if dryrun else 'error',
+        'message':      None,
+      }
+      results.append(result)
+      revocations.append((user.id, project_id, role_id, result))
+
+  if(dryrun):
+    return results
+
+  def revoke(revocation):
+    user_id, project_id, role_id, result = revocation
+    try:
+      connection.identity.unassign_project_role_from_user(project_id, user_id,
+          role_id)
+    except openstack.exceptions.SDKException:
+      result['message'] = 'Could not revoke the role'
+      return False
+
+    result['status'] = 'revoked'
+    return True
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    revoked = list(executor.map(revoke, revocations))
+
+  # Remove the revoked roles from the cache and the membership-index. Users
+  # who lost all their roles are removed from the index in a single query.
+  failed = set([r[0] for r, ok in zip(revocations, revoked) if not ok])
+  with transaction.atomic():
+    ProjectMembership.objects.filter(principal_type=ProjectMembership.USER,
+        principal_id__in=set([r[0] for r in revocations]) - failed).delete()
+    for (user_id, project_id, role_id, result), ok in \
+        zip(revocations, revoked):
+      if(ok and user_id in failed):
+        ProjectMembership.objects.filter(principal_type=ProjectMembership.USER,
+            principal_id=user_id, project_id=project_id,
+            role=result['role']).delete()
+
+  for project_id in set([r[1] for r, ok in zip(revocations, revoked) if ok]):
+    invalidateProject(project_id, rolefacets)
+
+  return results
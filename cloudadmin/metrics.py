@@ -0,0 +1,235 @@
+""" Utility methods to measure the latency of the backends cloudadmin uses
+
+This module contains a small timing layer. Every call to a backend (the
+openstack API's, the ceph rgw's, LDAP and the database) is timed, and recorded
+in a histogram per backend and per view. The histograms are kept in-process,
+and can be exported in the prometheus text-format. The calls made while
+handling a request are also summed up per backend, so that they can be
+reported back to the browser in a 'Server-Timing' header.
+"""
+
+import ipaddress
+import threading
+import time
+
+from configparser import NoOptionError, NoSectionError
+from contextlib import contextmanager
+from functools import wraps
+
+from cloudadmin.settings import parser
+
+# The upper bounds (in seconds) of the buckets of the latency-histograms.
+buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Maps the service-types used in the openstack service-catalog to the names
+# of the services.
+openstackservices = {
+  'identity':       'keystone',
+  'compute':        'nova',
+  'volume':         'cinder',
+  'volumev2':       'cinder',
+  'volumev3':       'cinder',
+  'block-storage':  'cinder',
+  'network':        'neutron',
+}
+
+# The histograms, indexed by (backend, view). Each histogram is a dict with
+# the keys 'buckets' (a count per bucket), 'count', 'sum' and 'errors'.
+histograms = {}
+lock = threading.Lock()
+
+# The name of the view and the per-backend timings of the request currently
+# handled by this thread.
+current = threading.local()
+
+def startRequest(view):
+  """ Starts collecting the timings of a request handled by a certain view """
+
+  current.view = view
+  current.timings = {}
+
+def setRequestView(view):
+  """ Sets the name of the view handling the current request """
+
+  current.view = view
+
+def finishRequest():
+  """ Stops collecting timings for the current request.
+
+  Returns a dict mapping each backend to a [count, seconds] list with the
+  number of calls made to it, and the total time spent, during the request.
+  """
+
+  timings = getattr(current, 'timings', {})
+  current.view = None
+  current.timings = {}
+  return timings
+
+def getRequestContext():
+  """ Returns the (view, timings) of the request handled by this thread """
+
+  return (getattr(current, 'view', None), getattr(current, 'timings', None))
+
+def observe(backend, seconds, error = False, context = None):
+  """ Records a single call to a backend, taking a certain number of seconds
+
+  The call is attributed to the request described by the supplied context (as
+  returned by getRequestContext), or to the request handled by this thread.
+  """
+
+  view, timings = context or getRequestContext()
+
+  with lock:
+    histogram = histograms.setdefault((backend, view or 'none'), {
+      'buckets': [0] * len(buckets), 'count': 0, 'sum': 0.0, 'errors': 0,
+    })
+    for i, bound in enumerate(buckets):
+      if(seconds <= bound):
+        histogram['buckets'][i] += 1
+    histogram['count'] += 1
+    histogram['sum'] += seconds
+    if(error):
+      histogram['errors'] += 1
+
+    if(timings is not None):
+      timing = timings.setdefault(backend, [0, 0.0])
+      timing[0] += 1
+      timing[1] += seconds
+
+@contextmanager
+def timed(backend, context = None):
+  """ A context-manager timing the code it wraps as a call to a backend.
+
+  Calls raising an exception are recorded as errors. See observe for the
+  context.
+  """
+
+  start = time.monotonic()
+  try:
+    yield
+  except Exception:
+    observe(backend, time.monotonic() - start, True, context)
+    raise
+  observe(backend, time.monotonic() - start, False, context)
+
+def timedFunction(backend, function):
+  """ Wraps a function so that every call to it is timed as a backend-call.
+
+  The backend is either a string, or a function which is called with the same
+  arguments as the wrapped function and returns the name of the backend. The
+  calls are attributed to the request handled by the thread wrapping the
+  function, so that calls made from a thread-pool are attributed correctly.
+  """
+
+  context = getRequestContext()
+
+  @wraps(function)
+  def wrapper(*args, **kwargs):
+    name = backend(*args, **kwargs) if callable(backend) else backend
+    with timed(name, context if context[0] else None):
+      return function(*args, **kwargs)
+  return wrapper
+
+def getOpenstackService(url, method = None, **kwargs):
+  """ Determines which openstack service a keystoneauth request is sent to.
+
+  The service is read from the request's endpoint-filter. Requests without one
+  (ie: the authentication itself) are sent to keystone.
+  """
+
+  endpoint = kwargs.get('endpoint_filter') or {}
+  servicetype = endpoint.get('service_type') or kwargs.get('service_type')
+  if(not servicetype):
+    return 'keystone'
+  return openstackservices.get(servicetype, servicetype)
+
+def instrumentOpenstackConnection(connection):
+  """ Makes every request sent through an openstack connection timed """
+
+  connection.session.request = timedFunction(getOpenstackService,
+      connection.session.request)
+  return connection
+
+def instrumentRGWConnection(connection):
+  """ Makes every request sent through a RGWAdmin connection timed """
+
+  connection.request = timedFunction('rgw', connection.request)
+  return connection
+
+def instrumentLDAPConnection(connection):
+  """ Makes every search sent through a ldap3 connection timed """
+
+  connection.search = timedFunction('ldap', connection.search)
+  return connection
+
+def getServerTiming(timings):
+  """ Formats the per-backend timings of a request as a Server-Timing header
+  """
+
+  return ', '.join('%s;desc="%d calls";dur=%.1f' % (backend, count,
+      seconds * 1000) for backend, (count, seconds) in sorted(timings.items()))
+
+def isAllowedToReadMetrics(request):
+  """ Determines if a request is allowed to read the metrics.
+
+  Superusers are always allowed. Other requests must come from an address
+  within one of the networks listed in the setting 'allowed_networks' in the
+  metrics-section of the configuration-file (comma-separated). If the setting
+  is missing, only superusers are allowed.
+  """
+
+  if(request.user.is_authenticated() and request.user.is_superuser):
+    return True
+
+  try:
+    networks = parser.get('metrics', 'allowed_networks')
+  except (NoSectionError, NoOptionError):
+    return False
+
+  try:
+    address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+  except ValueError:
+    return False
+
+  for network in networks.split(','):
+    try:
+      if(address in ipaddress.ip_network(network.strip())):
+        return True
+    except ValueError:
+      continue
+
+  return False
+
+def exportMetrics():
+  """ Returns all recorded histograms in the prometheus text-format """
+
+  with lock:
+    snapshot = {key: {
+      'buckets': list(h['buckets']), 'count': h['count'], 'sum': h['sum'],
+      'errors': h['errors'],
+    } for key, h in histograms.items()}
+
+  lines = [
+    '# HELP cloudadmin_backend_call_seconds Latency of calls to the backends',
+    '# TYPE cloudadmin_backend_call_seconds histogram',
+  ]
+  for (backend, view), histogram in sorted(snapshot.items()):
+    labels = 'backend="%s",view="%s"' % (backend, view)
+    for bound, count in zip(buckets, histogram['buckets']):
+      lines.append('cloudadmin_backend_call_seconds_bucket{%s,le="%s"} %d' %
+          (labels, bound, count))
+    lines.append('cloudadmin_backend_call_seconds_bucket{%s,le="+Inf"} %d' %
+        (labels, histogram['count']))
+    lines.append('cloudadmin_backend_call_seconds_sum{%s} %f' %
+        (labels, histogram['sum']))
+    lines.append('cloudadmin_backend_call_seconds_count{%s} %d' %
+        (labels, histogram['count']))
+
+  lines.append('# HELP cloudadmin_backend_call_errors_total Number of ' +
+      'failed calls to the backends')
+  lines.append('# TYPE cloudadmin_backend_call_errors_total counter')
+  for (backend, view), histogram in sorted(snapshot.items()):
+    lines.append('cloudadmin_backend_call_errors_total' +
+        '{backend="%s",view="%s"} %d' % (backend, view, histogram['errors']))
+
+  return '\n'.join(lines) + '\n'
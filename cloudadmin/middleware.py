@@ -1,8 +1,84 @@
-from django.http import HttpResponseForbidden
+from configparser import NoOptionError, NoSectionError
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
 from django.middleware.csrf import CsrfViewMiddleware
 from django.contrib.auth.models import User
 
+from cloudadmin.breaker import getBreakerSetting
+from cloudadmin.exceptions import BackendUnavailableException
+from cloudadmin.metrics import finishRequest, getServerTiming, observe, \
+    setRequestView, startRequest
 from cloudadmin.models import Token
+from cloudadmin.settings import parser
+from cloudadmin.utils import ExpiringLRUCache
+
+# Validated tokens are kept in-process for a short while, so that scripts
+# performing many API calls do not need a database lookup for every call.
+try:
+  tokencache = ExpiringLRUCache(1024, parser.getint('cache', 'token_timeout'))
+except (NoSectionError, NoOptionError, ValueError):
+  tokencache = ExpiringLRUCache(1024, 30)
+
+@receiver(request_started)
+def checkDatabaseConnections(sender, **kwargs):
+  """ Closes persistent database-connections which are no longer usable
+
+  When the database-connections are kept open between requests (CONN_MAX_AGE),
+  a connection might have been closed by the database-server while idle. Such
+  connections are closed before a request uses them, so that a new connection
+  is opened instead of the request failing.
+  """
+
+  if(not settings.DATABASE_HEALTH_CHECKS):
+    return
+
+  for connection in connections.all():
+    if(connection.connection is not None and not connection.is_usable()):
+      connection.close()
+
+def getToken(value):
+  """ Retrieves the token with the supplied value, or None if it is not found
+
+  The token is looked up by its hash, using the in-process token-cache if
+  possible.
+  """
+
+  key = Token.hashValue(value)
+  token = tokencache.get(key)
+
+  if(token is None):
+    try:
+      token = Token.objects.select_related('user').get(value_hash=key)
+    except Token.DoesNotExist:
+      return None
+    tokencache.set(key, token)
+
+  return token
+
+def getRequestTokenValue(request):
+  """ Returns the API-token supplied with a request, or None if there is none
+
+  The token is preferably read from an 'Authorization: Bearer <token>' header.
+  GET-requests might supply it as an 'api_key' query-parameter instead, and
+  for backwards compatibility POST-requests might supply it as an 'api_key'
+  form-parameter. The request-body is only parsed in the last case.
+  """
+
+  header = request.META.get('HTTP_AUTHORIZATION', '')
+  if(header[:7].lower() == 'bearer '):
+    return header[7:].strip() or None
+
+  if(request.method == 'GET'):
+    return request.GET.get('api_key') or None
+
+  if(request.method == 'POST'):
+    return request.POST.get('api_key') or None
+
+  return None
 
 class CloudadminCsrfViewMiddleware(CsrfViewMiddleware):
   """ Custom CSRF middleware modified to be used in front of an API
@@ -11,8 +87,9 @@ class CloudadminCsrfViewMiddleware(CsrfViewMiddleware):
   of the extension is to allow having certain API endpoints being available
   through normal web-access, while others could be available for scripts and
   similar. It differs from the original middleware-class in that it looks for
-  a variable named 'api_key' delivered as a POST parameter. There are three
-  paths through the middleware:
+  an API-key delivered in an 'Authorization: Bearer' header, or as a
+  parameter named 'api_key' (see getRequestTokenValue). There are three paths
+  through the middleware:
     1. If the api_key is not present, it simply calles the original CSRF-check
     2. If the api_key is present, but invalid (ie: non-existant or expired) a
        HttpResponseForbidden will be returned.
@@ -21,16 +98,74 @@ class CloudadminCsrfViewMiddleware(CsrfViewMiddleware):
 
   def process_view(self, request, view, view_args, view_kwargs):
     request.token = None
-    if request.POST.get('api_key'):
-      try:
-        request.token = Token.objects.get(value=request.POST['api_key'])
-      except:
-        return HttpResponseForbidden('Invalid API key')
+    value = getRequestTokenValue(request)
+    if value:
+      request.token = getToken(value)
 
-      if(request.token.isValid()):
+      if(request.token and request.token.isValid()):
+        request.token.touch()
         request.user = request.token.user 
         return view(request, *view_args, **view_kwargs)
       else:
         return HttpResponseForbidden('Invalid API key')
     else:
       return super().process_view(request, view, view_args, view_kwargs)
+
+class MetricsMiddleware(object):
+  """ Middleware collecting the time spent in the backends during a request
+
+  The middleware attributes all timed backend-calls (see cloudadmin.metrics)
+  made while handling a request to the view handling it. The database-queries
+  of the request are timed through django's query-log, which is enabled for
+  the duration of the request. The time spent per backend is reported in a
+  'Server-Timing' header on the response when DEBUG is enabled, or when the
+  request is made by a superuser, as the header reveals which backends a view
+  uses. It should be placed first in the list of middleware, so that it sees
+  the whole request.
+  """
+
+  def process_request(self, request):
+    startRequest(None)
+
+    request.querylog = {}
+    for connection in connections.all():
+      request.querylog[connection.alias] = (connection.force_debug_cursor,
+          len(connection.queries_log))
+      connection.force_debug_cursor = True
+
+  def process_view(self, request, view, view_args, view_kwargs):
+    setRequestView('%s.%s' % (view.__module__, view.__name__))
+
+  def process_response(self, request, response):
+    for connection in connections.all():
+      if(connection.alias not in getattr(request, 'querylog', {})):
+        continue
+
+      debug, start = request.querylog[connection.alias]
+      for query in list(connection.queries_log)[start:]:
+        observe('db', float(query['time']))
+      connection.force_debug_cursor = debug
+
+    timings = finishRequest()
+    user = getattr(request, 'user', None)
+    if(timings and (settings.DEBUG or (user is not None and
+        user.is_authenticated() and user.is_superuser))):
+      response['Server-Timing'] = getServerTiming(timings)
+
+    return response
+
+class BackendUnavailableMiddleware(object):
+  """ Middleware answering requests failing due to an unavailable backend
+
+  Requests failing because a backend can not be reached, or because its
+  circuit-breaker is open (see cloudadmin.breaker), are answered with a '503
+  Service Unavailable' and a Retry-After header, instead of a server-error.
+  """
+
+  def process_exception(self, request, exception):
+    if(not isinstance(exception, BackendUnavailableException)):
+      return None
+
+    response = HttpResponse(str(exception), status=503)
+    response['Retry-After'] = getBreakerSetting('reset', 30)
+    return response
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageSample',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('project_id', models.CharField(max_length=32)),
+                ('resolution', models.SmallIntegerField(default=0)),
+                ('timestamp', models.DateTimeField()),
+                ('instances', models.IntegerField(default=0)),
+                ('cpu', models.IntegerField(default=0)),
+                ('ram_mb', models.IntegerField(default=0)),
+                ('cinder_gb', models.IntegerField(default=0)),
+                ('cinder_volumes', models.IntegerField(default=0)),
+                ('swift_bytes', models.BigIntegerField(default=0)),
+                ('swift_objects', models.BigIntegerField(default=0)),
+                ('cpu_quota', models.IntegerField(default=0)),
+                ('ram_mb_quota', models.IntegerField(default=0)),
+                ('cinder_gb_quota', models.IntegerField(default=0)),
+                ('cinder_volumes_quota', models.IntegerField(default=0)),
+                ('swift_bytes_quota', models.BigIntegerField(default=0)),
+                ('swift_objects_quota', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='usagesample',
+            index_together=set([('project_id', 'resolution', 'timestamp')]),
+        ),
+    ]
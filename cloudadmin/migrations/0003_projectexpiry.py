@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0002_usagesample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectExpiry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('project_id', models.CharField(max_length=32, unique=True)),
+                ('name', models.CharField(max_length=64)),
+                ('expiry', models.DateField(null=True, default=None, db_index=True)),
+                ('deletable', models.BooleanField(default=False)),
+                ('notified_expiry', models.DateField(null=True, default=None)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('caproject', models.ForeignKey(null=True, default=None, on_delete=django.db.models.deletion.SET_NULL, to='cloudadmin.Project')),
+            ],
+        ),
+    ]
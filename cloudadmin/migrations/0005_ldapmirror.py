@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0004_ldapsyncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LDAPGroup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('dn', models.CharField(max_length=255, unique=True)),
+                ('cn', models.CharField(max_length=255, db_index=True)),
+                ('changed', models.CharField(max_length=32, default='')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LDAPMirrorState',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('base', models.CharField(max_length=255, unique=True)),
+                ('highwater', models.CharField(max_length=32, default='')),
+                ('last_sync', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LDAPUser',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('dn', models.CharField(max_length=255, unique=True)),
+                ('username', models.CharField(max_length=150, db_index=True)),
+                ('first_name', models.CharField(max_length=255, default='')),
+                ('last_name', models.CharField(max_length=255, default='')),
+                ('email', models.CharField(max_length=255, default='')),
+                ('changed', models.CharField(max_length=32, default='')),
+                ('groups', models.ManyToManyField(to='cloudadmin.LDAPGroup')),
+            ],
+        ),
+    ]
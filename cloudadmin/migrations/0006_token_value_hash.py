@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hashTokens(apps, schema_editor):
+    Token = apps.get_model('cloudadmin', 'Token')
+    for token in Token.objects.all():
+        token.value_hash = hashlib.sha256(
+            token.value.encode('utf-8')).hexdigest()
+        token.save(update_fields=['value_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0005_ldapmirror'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='value_hash',
+            field=models.CharField(max_length=64, default=''),
+            preserve_default=False,
+        ),
+        migrations.RunPython(hashTokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='token',
+            name='value',
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='value_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='last_used',
+            field=models.DateTimeField(null=True, default=None),
+        ),
+        migrations.AlterField(
+            model_name='token',
+            name='expiry',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
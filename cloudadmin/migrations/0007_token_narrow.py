@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0006_token_value_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='token',
+            name='cinder_gb',
+        ),
+        migrations.RemoveField(
+            model_name='token',
+            name='cinder_volumes',
+        ),
+        migrations.RemoveField(
+            model_name='token',
+            name='cpu_cores',
+        ),
+        migrations.RemoveField(
+            model_name='token',
+            name='ram_gb',
+        ),
+        migrations.RemoveField(
+            model_name='token',
+            name='swift_gb',
+        ),
+        migrations.RemoveField(
+            model_name='token',
+            name='swift_objects',
+        ),
+        migrations.AlterModelOptions(
+            name='token',
+            options={},
+        ),
+        migrations.AlterIndexTogether(
+            name='token',
+            index_together=set([('value_hash', 'expiry')]),
+        ),
+    ]
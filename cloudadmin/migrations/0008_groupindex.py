@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def indexGroups(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    GroupIndex = apps.get_model('cloudadmin', 'GroupIndex')
+
+    entries = []
+    for group in Group.objects.all().iterator():
+        m = re.match(r'^CN=((\\.|[^,])*),', group.name, re.IGNORECASE)
+        name = m.group(1) if m else group.name
+        entries.append(GroupIndex(group=group, cn=name.lower()[:255]))
+    GroupIndex.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0006_require_contenttypes_0002'),
+        ('cloudadmin', '0007_token_narrow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupIndex',
+            fields=[
+                ('group', models.OneToOneField(primary_key=True, serialize=False, to='auth.Group', on_delete=django.db.models.deletion.CASCADE)),
+                ('cn', models.CharField(max_length=255, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(indexGroups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0008_groupindex'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='name',
+            field=models.CharField(max_length=50, db_index=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='quotatemplate',
+            index_together=set([('project', 'default')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloudadmin', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.CharField(db_index=True, max_length=32)),
+                ('project_name', models.CharField(max_length=64)),
+                ('principal_type', models.CharField(max_length=5)),
+                ('principal_id', models.CharField(db_index=True, max_length=64)),
+                ('name', models.CharField(max_length=255)),
+                ('domain', models.CharField(max_length=64)),
+                ('role', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='projectmembership',
+            index_together=set([('principal_type', 'name')]),
+        ),
+    ]
@@ -1,16 +1,17 @@
 from datetime import timedelta
+import hashlib
 import string
 from random import choice
 
 from django.contrib.auth.models import Group, User
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
 from cloudadmin.exceptions import InsufficientQuotaException, \
         UsageTooHighException
-from cloudadmin.utils import machineReadable, humanReadable
+from cloudadmin.utils import getCNFromDN, machineReadable, humanReadable
 
 # A class representing a certain project.
 class Project(models.Model):
@@ -20,7 +21,7 @@ class Project(models.Model):
   own quotas), and manage access to these openstack projects.
   """
 
-  name          = models.CharField(max_length=50)
+  name          = models.CharField(max_length=50, db_index=True)
   description   = models.TextField()
   projectprefix = models.CharField(max_length=50)
   parent        = models.ForeignKey('Project', null=True, default=None, 
@@ -386,6 +387,11 @@ class QuotaTemplate(QuotaInformation):
                                      on_delete=models.CASCADE)
   default      = models.BooleanField(default=False)
 
+  class Meta:
+    index_together = [
+      ('project', 'default'),
+    ]
+
   def asDict(self):
     """ Returns the quota-template as a dict """
 
@@ -414,30 +420,299 @@ class Usage(QuotaInformation):
     data['last_updated'] = self.last_updated
     return data
 
-class Token(QuotaInformation):
+class Token(models.Model):
   """ A class representing API tokens.
 
   These tokens are used by the API-handlers to ensure that an app have access.
+  Only a sha256-hash of the token is stored, so that the tokens can be looked
+  up using an index without storing them in clear text.
   """
 
-  value     = models.CharField(max_length=32)
-  created   = models.DateTimeField(auto_now_add=True)
-  last_used = models.DateTimeField(auto_now=True, null=True)
-  expiry    = models.DateTimeField()
-  user      = models.ForeignKey(User)
+  value_hash = models.CharField(max_length=64, unique=True)
+  created    = models.DateTimeField(auto_now_add=True)
+  last_used  = models.DateTimeField(null=True, default=None)
+  expiry     = models.DateTimeField(db_index=True)
+  user       = models.ForeignKey(User)
+
+  class Meta:
+    index_together = [
+      ('value_hash', 'expiry'),
+    ]
 
   def __str__(self):
     return "Token representing %s expires at %s" % (self.user, self.expiry)
 
+  @staticmethod
+  def hashValue(value):
+    """ Returns the hash which is stored for a certain token-value """
+
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
   def generateToken(self):
-    """ Generates a new API-token, and sets the validity to 4 hours """
+    """ Generates a new API-token, and sets the validity to 4 hours
+
+    Returns the token-value, which is not stored and thus only available here.
+    """
 
     chars = string.ascii_letters + string.digits
-    self.value  = ''.join(choice(chars) for _ in range(30))
+    value = ''.join(choice(chars) for _ in range(30))
+    self.value_hash = self.hashValue(value)
     self.expiry = timezone.now() + timedelta(hours=4) 
     self.save()
+    return value
 
   def isValid(self):
     """ Returns a boolean if the current API-token is valid """
 
     return (self.expiry > timezone.now())
+
+  def touch(self):
+    """ Updates the timestamp for when the token was last used
+
+    To avoid a write on every API-call the timestamp is only updated if it is
+    more than a minute old.
+    """
+
+    now = timezone.now()
+    if(self.last_used is None or now - self.last_used > timedelta(minutes=1)):
+      Token.objects.filter(pk=self.pk).update(last_used=now)
+      self.last_used = now
+
+class UsageSample(models.Model):
+  """ A sample of an openstack project's resource-usage at a certain time.
+
+  Samples are collected with the full resolution ('raw'), and are later
+  downsampled to 'hourly' and 'daily' samples storing the peak usage within
+  each hour/day. The project's quota at the time of the sample is stored as
+  well, so that trends can be compared against it.
+  """
+
+  RAW    = 0
+  HOURLY = 1
+  DAILY  = 2
+  RESOLUTIONS = {
+    'raw':    RAW,
+    'hourly': HOURLY,
+    'daily':  DAILY,
+  }
+
+  project_id     = models.CharField(max_length=32)
+  resolution     = models.SmallIntegerField(default=RAW)
+  timestamp      = models.DateTimeField()
+
+  instances      = models.IntegerField(default = 0)
+  cpu            = models.IntegerField(default = 0)
+  ram_mb         = models.IntegerField(default = 0)
+  cinder_gb      = models.IntegerField(default = 0)
+  cinder_volumes = models.IntegerField(default = 0)
+  swift_bytes    = models.BigIntegerField(default = 0)
+  swift_objects  = models.BigIntegerField(default = 0)
+
+  cpu_quota            = models.IntegerField(default = 0)
+  ram_mb_quota         = models.IntegerField(default = 0)
+  cinder_gb_quota      = models.IntegerField(default = 0)
+  cinder_volumes_quota = models.IntegerField(default = 0)
+  swift_bytes_quota    = models.BigIntegerField(default = 0)
+  swift_objects_quota  = models.BigIntegerField(default = 0)
+
+  class Meta:
+    index_together = [('project_id', 'resolution', 'timestamp')]
+
+  def __str__(self):
+    return "Usage of %s at %s" % (self.project_id, self.timestamp)
+
+  def getSampleElements(self = None):
+    """ Returns a list of the usage-values stored in a sample """
+
+    return [
+      'instances', 'cpu', 'ram_mb', 
+      'cinder_gb', 'cinder_volumes', 
+      'swift_bytes', 'swift_objects',
+    ]
+
+  def getQuotaElements(self = None):
+    """ Returns a dict mapping usage-values to the data-member with its quota
+    """
+
+    return {
+      'cpu':            'cpu_quota',
+      'ram_mb':         'ram_mb_quota',
+      'cinder_gb':      'cinder_gb_quota',
+      'cinder_volumes': 'cinder_volumes_quota',
+      'swift_bytes':    'swift_bytes_quota',
+      'swift_objects':  'swift_objects_quota',
+    }
+
+  def asDict(self):
+    """ Return the sample as a dict. """
+
+    data = {'timestamp': self.timestamp}
+    for element in self.getSampleElements():
+      data[element] = getattr(self, element)
+    for element in self.getQuotaElements().values():
+      data[element] = getattr(self, element)
+    return data
+
+class ProjectExpiry(models.Model):
+  """ A class representing the expiry-date of an openstack project.
+
+  The table is maintained by the expiry-scanner, which reads the 'Expire' tags
+  of all openstack projects in a single listing. It lets cloudadmin find
+  expiring projects without querying openstack.
+  """
+
+  project_id      = models.CharField(max_length=32, unique=True)
+  name            = models.CharField(max_length=64)
+  expiry          = models.DateField(null=True, default=None, db_index=True)
+  caproject       = models.ForeignKey('Project', null=True, default=None,
+                                      on_delete=models.SET_NULL)
+  deletable       = models.BooleanField(default=False)
+  notified_expiry = models.DateField(null=True, default=None)
+  last_updated    = models.DateTimeField(auto_now=True)
+
+  def __str__(self):
+    return "%s expires at %s" % (self.name, self.expiry)
+
+class LDAPSyncState(models.Model):
+  """ A class representing the state of a user's last sync from LDAP
+
+  The fingerprint is a hash of the user's group-memberships in LDAP and the
+  attributes derived from them. If it is unchanged at login, the sync of the
+  user's relations can be skipped.
+  """
+
+  user        = models.OneToOneField(User, on_delete=models.CASCADE)
+  fingerprint = models.CharField(max_length=64)
+  last_synced = models.DateTimeField(auto_now=True)
+
+  def __str__(self):
+    return "%s was synced from LDAP at %s" % (self.user, self.last_synced)
+
+class LDAPGroup(models.Model):
+  """ A class representing a group mirrored from the LDAP directory """
+
+  dn      = models.CharField(max_length=255, unique=True)
+  cn      = models.CharField(max_length=255, db_index=True)
+  changed = models.CharField(max_length=32, default='')
+
+  def __str__(self):
+    return self.cn
+
+class LDAPUser(models.Model):
+  """ A class representing a user mirrored from the LDAP directory
+
+  The users are mirrored together with their group-memberships, so that groups
+  can be resolved for users which have not yet logged in to cloudadmin.
+  """
+
+  dn         = models.CharField(max_length=255, unique=True)
+  username   = models.CharField(max_length=150, db_index=True)
+  first_name = models.CharField(max_length=255, default='')
+  last_name  = models.CharField(max_length=255, default='')
+  email      = models.CharField(max_length=255, default='')
+  changed    = models.CharField(max_length=32, default='')
+  groups     = models.ManyToManyField(LDAPGroup)
+
+  def __str__(self):
+    return self.username
+
+class LDAPMirrorState(models.Model):
+  """ A class storing how far the LDAP-mirror have synced a search-base
+
+  The base is stored as '<objectclass>:<search-base>'. The highwater is the
+  highest value of the sync-attribute (uSNChanged or modifyTimestamp) seen in
+  the last sync, and is used to only retrieve entries changed since then.
+  """
+
+  base      = models.CharField(max_length=255, unique=True)
+  highwater = models.CharField(max_length=32, default='')
+  last_sync = models.DateTimeField(auto_now=True)
+
+  def __str__(self):
+    return "%s is synced to %s" % (self.base, self.highwater)
+
+class GroupIndex(models.Model):
+  """ A class storing a normalized, searchable name for each group
+
+  The groups synced from LDAP are named after their DN. The index stores the
+  CN of each group in lower-case, so that the groups can be searched by prefix
+  using a database-index instead of scanning every group.
+  """
+
+  group = models.OneToOneField(Group, on_delete=models.CASCADE,
+                               primary_key=True)
+  cn    = models.CharField(max_length=255, db_index=True)
+
+  def __str__(self):
+    return self.cn
+
+  @staticmethod
+  def normalize(name):
+    """ Returns the normalized name stored for a group with a certain name """
+
+    return getCNFromDN(name).lower()[:255]
+
+  @classmethod
+  def indexGroups(cls, groups):
+    """ Adds the supplied groups which are not already in the index """
+
+    existing = set(cls.objects.filter(group__in=groups). \
+        values_list('group_id', flat=True))
+    missing = [cls(group=g, cn=cls.normalize(g.name)) for g in groups
+        if g.id not in existing]
+
+    try:
+      with transaction.atomic():
+        cls.objects.bulk_create(missing)
+    except IntegrityError:
+      for entry in missing:
+        cls.objects.get_or_create(group=entry.group,
+            defaults={'cn': entry.cn})
+
+class ProjectMembership(models.Model):
+  """ A class representing a role a user or a group have in an openstack
+  project
+
+  The table is a reverse index of the role-assignments in openstack, so that
+  the projects a certain user or group have roles in can be found without
+  querying every project. The names are stored in lower-case, so that they
+  can be looked up case-insensitively using the index.
+  """
+
+  USER  = 'user'
+  GROUP = 'group'
+
+  project_id     = models.CharField(max_length=32, db_index=True)
+  project_name   = models.CharField(max_length=64)
+  principal_type = models.CharField(max_length=5)
+  principal_id   = models.CharField(max_length=64, db_index=True)
+  name           = models.CharField(max_length=255)
+  domain         = models.CharField(max_length=64)
+  role           = models.CharField(max_length=64)
+
+  class Meta:
+    index_together = [('principal_type', 'name')]
+
+  def __str__(self):
+    return "%s %s have %s in %s" % (self.principal_type, self.name, self.role,
+        self.project_name)
+
+  def asDict(self):
+    """ Return the membership as a dict. """
+
+    return {
+      'project_id':   self.project_id,
+      'project_name': self.project_name,
+      'type':         self.principal_type,
+      'id':           self.principal_id,
+      'name':         self.name,
+      'domain':       self.domain,
+      'role':         self.role,
+    }
+
+@receiver(post_save, sender=Group)
+def indexGroup(sender, instance, **kwargs):
+  """ Keeps the group-index up to date when a group is created or renamed """
+
+  GroupIndex.objects.update_or_create(group=instance,
+      defaults={'cn': GroupIndex.normalize(instance.name)})
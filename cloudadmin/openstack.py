@@ -2,20 +2,52 @@ import datetime
 import openstack
 import re
 
+from concurrent.futures import ThreadPoolExecutor
+from configparser import NoOptionError, NoSectionError
+
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.models import Group, User
 from rgwadmin.exceptions import NoSuchUser
 
+from cloudadmin.breaker import protectOpenstackConnection
+from cloudadmin.cache import getCachedProjectFacet, \
+    getCachedProjectFacetEntry, getCachedValue, invalidateProject
 from cloudadmin.ceph import getRGWConnection, getRGWUserQuota, getRGWUserUsage
 from cloudadmin.exceptions import UsageTooHighException
-from cloudadmin.models import Project, QuotaInformation
+from cloudadmin.metrics import instrumentOpenstackConnection
+from cloudadmin.models import Project, ProjectMembership, QuotaInformation
 from cloudadmin.settings import parser
-from cloudadmin.utils import humanReadable
+from cloudadmin.utils import humanReadable, rolenames
+
+# The facets of an openstack project which can be retrieved by
+# getOpenstackProject.
+openstackfacets = ['meta', 'quota', 'usage', 'swift', 'members']
+
+# The cached facets of an openstack project which change when roles are
+# assigned or revoked in it.
+rolefacets = ['assignments', 'members']
+
+# The resources the usage is reported for, per part, as (resource, name)
+# tuples. The percentage of the quota used is stored as '<name>_percent'.
+usageresources = {
+  'compute': [('instances', 'instances'), ('cpu', 'cpu'), ('ram_mb', 'ram')],
+  'volumes': [('gigabytes', 'gigabytes'), ('volumes', 'volumes')],
+}
 
 def getOpenstackConnection():
   """ This method returns a valid, and initialized openstack connection object
+
+  Requests to openstack time out after the number of seconds set in the
+  setting 'timeout' in the openstack-section of the configuration-file
+  (defaulting to 10), and are sent through the circuit-breaker of the service
+  they are sent to.
   """
 
+  try:
+    timeout = parser.getint('openstack', 'timeout')
+  except (NoOptionError, ValueError):
+    timeout = 10
+
   connection = openstack.connect(
     region = parser.get('openstack', 'region'), 
     auth = {
@@ -26,12 +58,104 @@ def getOpenstackConnection():
       'user_domain_name': parser.get('openstack', 'user_domain_name'),
       'username':         parser.get('openstack', 'username'),
     },
+    api_timeout = timeout,
   )
 
-  return connection
+  return protectOpenstackConnection(instrumentOpenstackConnection(connection))
+
+def getOpenstackRegions():
+  """ Returns the names of the openstack regions to collect quotas and usage
+  from
+
+  The regions are read from the setting 'regions' in the openstack-section of
+  the configuration-file (comma-separated), and defaults to the setting
+  'region' alone.
+  """
+
+  try:
+    regions = parser.get('openstack', 'regions')
+  except (NoSectionError, NoOptionError):
+    return [parser.get('openstack', 'region')]
+
+  return [r.strip() for r in regions.split(',') if r.strip()]
+
+def getOpenstackRegionConnections(connection):
+  """ Returns a dict mapping each of the configured regions to a connection to
+  it.
+
+  The regions share keystone, so the connections to the other regions reuse
+  the session (and thus the authentication, timeouts and circuit-breakers) of
+  the supplied connection, which is used as it is for its own region.
+  """
+
+  connections = {}
+  for region in getOpenstackRegions():
+    if(region == connection.config.region_name):
+      connections[region] = connection
+    else:
+      connections[region] = openstack.connection.Connection(
+          session = connection.session, region_name = region)
+
+  return connections
+
+def sumOpenstackQuotas(values):
+  """ Sums up a quota from several regions. A quota which is unlimited (-1) in
+  any of the regions is unlimited in total. """
+
+  if(-1 in values):
+    return -1
+  return sum(values)
+
+def getPercentage(used, limit):
+  """ Returns how many percent of a limit is used, or 100 if the limit is 0 """
+
+  try:
+    return int((used * 100) / limit)
+  except ZeroDivisionError:
+    return 100
 
 def getOpenstackProjectQuota(connection, project_id):
-  """ Queries the openstack-API for project_quotas
+  """ Queries the openstack-API's of all regions for project_quotas
+
+  The quotas of each region are retrieved concurrently (see
+  getOpenstackRegionQuota). The returned dict contains the sum of the quotas
+  of all the regions, and the quotas of each region in 'regions'. A quota
+  which is unlimited in any region is unlimited in the sum, and a volume-type
+  is allowed if it is allowed in any region.
+
+  Cloudadmin only sets the quotas of the connection's own region, and the
+  usage of the cloudadmin projects is booked from that region alone. Its name
+  is stored in 'region', so that the quotas being managed can be found in
+  'regions'.
+  """
+
+  connections = getOpenstackRegionConnections(connection)
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    regions = dict(zip(connections, executor.map(
+        lambda c: getOpenstackRegionQuota(c, project_id),
+        connections.values())))
+
+  quotas = list(regions.values())
+  quota = {}
+  for part in ['compute', 'network', 'volumes']:
+    quota[part] = {}
+    for key, value in quotas[0][part].items():
+      if(isinstance(value, int)):
+        quota[part][key] = sumOpenstackQuotas([q[part][key] for q in quotas])
+
+  quota['compute']['ram_human'] = '%sB' % \
+      humanReadable(quota['compute']['ram_mb'], 'm')
+  quota['volumes']['gigabytes_human'] = '%sB' % \
+      humanReadable(quota['volumes']['gigabytes'], 'g')
+  quota['volumes']['types'] = {vtype: any(q['volumes']['types'][vtype]
+      for q in quotas) for vtype in quotas[0]['volumes']['types']}
+
+  quota['region'] = connection.config.region_name
+  quota['regions'] = regions
+  return quota
+
+def getOpenstackRegionQuota(connection, project_id):
+  """ Queries the openstack-API of a single region for project_quotas
 
   This method queries the openstack-API for the supplied project_id's project
   quotas, and returns the quotas in a dict. The dict have the following
@@ -86,7 +210,7 @@ def getOpenstackUser(connection, username, domain_id):
   """
   try:
     users = connection.list_users(domain_id=domain_id, name=username)
-  except:
+  except openstack.exceptions.SDKException:
     return None
 
   user = None
@@ -103,7 +227,7 @@ def getOpenstackGroup(connection, groupname, domain_id):
   """
   try:
     groups = connection.search_groups(groupname, domain_id=domain_id)
-  except:
+  except openstack.exceptions.SDKException:
     return None
 
   group = None
@@ -113,11 +237,141 @@ def getOpenstackGroup(connection, groupname, domain_id):
 
   return group
 
+def getOpenstackWorkers():
+  """ Returns how many concurrent requests we are allowed to send to openstack
+
+  The value is read from the setting 'workers' in the openstack-section of the
+  configuration-file, and defaults to 8.
+  """
+
+  try:
+    return parser.getint('openstack', 'workers')
+  except (NoSectionError, NoOptionError, ValueError):
+    return 8
+
+def getOpenstackRoles(connection, rolenames):
+  """ Retrieves a set of roles from openstack using a single listing.
+
+  Returns a dict mapping each of the supplied role-names to its role-object.
+  Role-names which are not found in openstack is left out of the dict.
+  """
+
+  roles = {}
+  for role in connection.identity.roles():
+    if(role.name in rolenames):
+      roles[role.name] = role
+
+  return roles
+
+def getOpenstackDomains(connection, domainnames):
+  """ Retrieves a set of domains from openstack using a single listing.
+
+  Returns a dict mapping each of the supplied domain-names to its
+  domain-object. A domain can be referenced either by its name or by its ID.
+  Domains which are not found in openstack is left out of the dict.
+  """
+
+  domains = {}
+  for domain in connection.identity.domains():
+    if(domain.name in domainnames):
+      domains[domain.name] = domain
+    if(domain.id in domainnames):
+      domains[domain.id] = domain
+
+  return domains
+
+def getOpenstackPrincipals(connection, principals):
+  """ Retrieves multiple users and groups from openstack concurrently.
+
+  The supplied principals should be an iterable of (type, name, domain_id)
+  tuples where type is either 'user' or 'group'. Each distinct principal is
+  only looked up once.
+
+  Returns a dict mapping each of the (type, name, domain_id) tuples to the
+  user/group object, or to None if the principal could not be found.
+  """
+
+  def lookup(principal):
+    ptype, name, domain_id = principal
+    if(ptype == 'user'):
+      return getOpenstackUser(connection, name, domain_id)
+    else:
+      return getOpenstackGroup(connection, name, domain_id)
+
+  principals = list(set(principals))
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    results = executor.map(lookup, principals)
+
+  return dict(zip(principals, results))
+
+def assignOpenstackRoles(connection, project_id, assignments):
+  """ Assigns multiple roles in an openstack project concurrently.
+
+  The supplied assignments should be a list of dicts with the keys 'type'
+  ('user' or 'group'), 'principal' (the user/group object) and 'role' (the
+  role-object).
+
+  Returns a list, in the same order as the assignments, where each element is
+  None if the role were assigned, or a string describing the error otherwise.
+  """
+
+  def assign(assignment):
+    try:
+      if(assignment['type'] == 'user'):
+        connection.identity.assign_project_role_to_user(project_id,
+            assignment['principal'], assignment['role'])
+      else:
+        connection.identity.assign_project_role_to_group(project_id,
+            assignment['principal'], assignment['role'])
+    except openstack.exceptions.SDKException:
+      return 'Could not assign role to %s' % assignment['type']
+    return None
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    return list(executor.map(assign, assignments))
+
 def getOpenstackProjectUsage(connection, project_id):
-  """ Queries the openstack API for a projects current usage.
+  """ Queries the openstack API's of all regions for a projects current usage.
+
+  The usage of each region is retrieved concurrently (see
+  getOpenstackRegionUsage). The returned dict contains the sum of the usage in
+  all the regions, with percentages of the summed quotas, and the usage of
+  each region in 'regions'.
+  """
+
+  connections = getOpenstackRegionConnections(connection)
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    regions = dict(zip(connections, executor.map(
+        lambda c: getOpenstackRegionUsage(c, project_id),
+        connections.values())))
+
+  usages = list(regions.values())
+  usage = {}
+  for part, resources in usageresources.items():
+    usage[part] = {}
+    for resource, name in resources:
+      used = sum([u[part][resource] for u in usages])
+      limit = sumOpenstackQuotas([u[part]['%s_quota' % resource]
+          for u in usages])
+      usage[part][resource] = used
+      usage[part]['%s_quota' % resource] = limit
+      usage[part]['%s_percent' % name] = getPercentage(used, limit)
+
+  usage['compute']['ram_human'] = '%sB' % \
+      humanReadable(usage['compute']['ram_mb'], 'm')
+  usage['volumes']['gigabytes_human'] = '%sB' % \
+      humanReadable(usage['volumes']['gigabytes'], 'g')
+
+  usage['regions'] = regions
+  return usage
+
+def getOpenstackRegionUsage(connection, project_id):
+  """ Queries the openstack API of a single region for a projects current
+  usage.
   
   The method also calculates a percentage of the used projects. If the quota for
-  a resource is 0, the percentage is set to 100.
+  a resource is 0, the percentage is set to 100. The quotas the percentages are
+  calculated from are included as '<resource>_quota'.
   """
 
   quota = {}
@@ -126,37 +380,25 @@ def getOpenstackProjectUsage(connection, project_id):
   compute = connection.get_compute_limits(project_id)
   quota['compute'] = {
     'instances': compute['total_instances_used'],
+    'instances_quota': compute['max_total_instances'],
     'cpu': compute['total_cores_used'],
+    'cpu_quota': compute['max_total_cores'],
     'ram_mb': compute['total_ram_used'],
+    'ram_mb_quota': compute['max_total_ram_size'],
     'ram_human': '%sB' % humanReadable(compute['total_ram_used'], 'm'),
   }
 
-  try:
-    quota['compute']['instances_percent'] = int(
-        (compute['total_instances_used'] * 100) / 
-        compute['max_total_instances']
-    )
-  except ZeroDivisionError:
-    quota['compute']['instances_percent'] = 100
-
-  try:
-    quota['compute']['cpu_percent'] = int(
-        (compute['total_cores_used'] * 100) / compute['max_total_cores'])
-  except ZeroDivisionError:
-    quota['compute']['cpu_percent'] = 100
-
-  try:
-    quota['compute']['ram_percent'] = int(
-        (compute['total_ram_used'] * 100) / compute['max_total_ram_size'])
-  except ZeroDivisionError:
-    quota['compute']['ram_percent'] = 100
-
+  for resource, name in usageresources['compute']:
+    quota['compute']['%s_percent' % name] = getPercentage(
+        quota['compute'][resource], quota['compute']['%s_quota' % resource])
 
   # Determine cinder usage
   volumequota = connection.get_volume_quotas(project_id)
   quota['volumes'] = {
     'gigabytes': 0, 
+    'gigabytes_quota': volumequota['gigabytes'],
     'volumes': 0, 
+    'volumes_quota': volumequota['volumes'],
   }
 
   # For each volume belonging to project, sum up the size and number of volumes
@@ -169,17 +411,9 @@ def getOpenstackProjectUsage(connection, project_id):
   quota['volumes']['gigabytes_human'] = '%sB' % \
       humanReadable(quota['volumes']['gigabytes'], 'g')
 
-  try:
-    quota['volumes']['gigabytes_percent'] = int(
-        (quota['volumes']['gigabytes'] * 100) / volumequota['gigabytes'])
-  except ZeroDivisionError:
-    quota['volumes']['gigabytes_percent'] = 100
-
-  try:
-    quota['volumes']['volumes_percent'] = int(
-        (quota['volumes']['volumes'] * 100) / volumequota['volumes'])
-  except ZeroDivisionError:
-    quota['volumes']['volumes_percent'] = 100
+  for resource, name in usageresources['volumes']:
+    quota['volumes']['%s_percent' % name] = getPercentage(
+        quota['volumes'][resource], quota['volumes']['%s_quota' % resource])
   
   return quota
 
@@ -253,29 +487,146 @@ def getOpenstackRoleAssignments(connection, project_id):
     'groups': groups,
   }
 
-def getOpenstackProject(connection, project_id):
-  """ Retrieves information about an openstack-project from the openstack API
+def getOpenstackRoleAssignmentIndex(connection, project_id):
+  """ Returns an index of the users and groups having roles in a project
+
+  The index is built from a single listing of the project's role-assignments,
+  without looking up the users and groups themselves, and is cached for a short
+  while. It is a dict mapping the ID of each user and group to a dict with the
+  keys 'type' ('user' or 'group') and 'roles' (a list of role-IDs).
+  """
+
+  def build():
+    index = {}
+    for ra in connection.identity.role_assignments(scope_project_id=project_id):
+      if(ra.user):
+        principal = index.setdefault(ra.user['id'], 
+            {'type': 'user', 'roles': []})
+      elif(ra.group):
+        principal = index.setdefault(ra.group['id'], 
+            {'type': 'group', 'roles': []})
+      else:
+        continue
+
+      principal['roles'].append(ra.role['id'])
+
+    return index
+
+  return getCachedProjectFacet(project_id, 'assignments', build)
+
+def getOpenstackRoleIDs(connection):
+  """ Returns a dict mapping the names of all roles in openstack to their IDs
+
+  The roles are retrieved using a single listing, and cached for a short while.
+  """
+
+  def build():
+    return {role.name: role.id for role in connection.identity.roles()}
+
+  return getCachedValue('cloudadmin:roles', build)
+
+def parseRoleAssignmentID(value):
+  """ Parses a role-assignment ID on the format <user_id|group_id>:<rolename>
+
+  Returns a (principal_id, rolename) tuple. Raises a ValueError if the value is
+  in the wrong format, or if the role is not managed by cloudadmin.
+  """
+
+  try:
+    principal_id, rolename = value.split(':')
+  except (AttributeError, ValueError):
+    raise ValueError('The ID must be on the format ' +
+        '<user_id|group_id>:<rolename>')
+
+  # Make sure that the user|group ID is in a valid format (ie: a hex-string).
+  if(not re.match(r'^[0-9a-f]+$', principal_id)):
+    raise ValueError('The supplied user/group ID is invalid')
+
+  # Make sure the supplied rolename is a role allowed to be managed by
+  # cloudadmin.
+  if(rolename not in rolenames):
+    raise ValueError('The supplied role is invalid')
+
+  return (principal_id, rolename)
+
+def revokeOpenstackRoles(connection, project_id, removals):
+  """ Revokes multiple roles in an openstack project concurrently.
+
+  The supplied removals should be a list of (principal_id, rolename) tuples,
+  where principal_id is the ID of a user or a group. Whether an ID belongs to a
+  user or a group is determined from the project's role-assignment index,
+  which is refreshed once if any of the IDs are missing from it.
+
+  Returns a list, in the same order as the removals, where each element is None
+  if the role were revoked, or a string describing the error otherwise.
+  """
+
+  roles = getOpenstackRoleIDs(connection)
+  index = getOpenstackRoleAssignmentIndex(connection, project_id)
+  if([r for r in removals if r[0] not in index]):
+    invalidateProject(project_id, rolefacets)
+    index = getOpenstackRoleAssignmentIndex(connection, project_id)
+
+  def revoke(removal):
+    principal_id, rolename = removal
+
+    if(rolename not in roles):
+      return 'Could not find role'
+    if(principal_id not in index):
+      return 'Could not find a user or a group with the supplied ID in ' + \
+          'the project'
+
+    try:
+      if(index[principal_id]['type'] == 'user'):
+        connection.identity.unassign_project_role_from_user(project_id,
+            principal_id, roles[rolename])
+      else:
+        connection.identity.unassign_project_role_from_group(project_id,
+            principal_id, roles[rolename])
+    except openstack.exceptions.SDKException:
+      return 'Could not revoke %s for %s' % (rolename, principal_id)
+    return None
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    errors = list(executor.map(revoke, removals))
+
+  invalidateProject(project_id, rolefacets)
+  return errors
+
+def getOpenstackProjectMeta(connection, project_id, fresh = False):
+  """ Retrieves the metadata of an openstack-project from the openstack API
+
+  Only the project itself is retrieved from keystone; quotas, usage and
+  role-assignments are not collected. The metadata is returned as a dict with
+  the projects id, name, fullname (the name including the prefix),
+  description, domain_id and a key for each of its tags.
+
+  The metadata is cached for a short while, but an expired copy is never
+  returned, as the metadata decides who have access to the project. If 'fresh'
+  is True the cache is bypassed.
+  """
+
+  return getCachedProjectFacet(project_id, 'meta', buildOpenstackProjectMeta,
+      connection, project_id, fresh=fresh)
 
-  The information is returned in a large dict
+def buildOpenstackProjectMeta(connection, project_id):
+  """ Retrieves the metadata of an openstack-project, bypassing the cache.
+
+  See getOpenstackProjectMeta for details.
   """
 
   try:
     osproject = connection.identity.get_project(project_id)
-  except:
+  except openstack.exceptions.SDKException:
     raise LookupError('Could not retrieve openstack project')
 
   data = {}
   data['id'] = osproject.id
   data['name'] = osproject.name
+  data['fullname'] = osproject.name
   data['description'] = osproject.description
   data['domain_id'] = osproject.domain_id
-  data['domain_name'] = connection.identity.get_domain(osproject.domain_id).name
 
-  data['quota'] = getOpenstackProjectQuota(connection, data['id'])
-  data['quota']['swift'] = getRGWUserQuota('%s$%s' % (data['id'], data['id'])) 
-  data['usage'] = getOpenstackProjectUsage(connection, data['id'])
-  data['usage']['swift'] = getRGWUserUsage('%s$%s' % (data['id'], data['id']))
-  
   # Iterate tags, and store them as values in the dict. The tag DELETABLE is a
   # bit special, and is stored a boolean.
   for tag in osproject.tags:
@@ -285,20 +636,6 @@ def getOpenstackProject(connection, project_id):
     elif(tag == 'DELETABLE'):
       data['deletable'] = True
 
-  # If there is not an Expiry-date set, try to read the old-style
-  # expiry-parameter. If that parameter is found, set the expiry in the new
-  # tag-format.
-  if('Expire' not in data):
-    oldstyleproject = connection.get_project(project_id)
-    try:
-      m = re.match(r'^([0-9]{2})\.([0-9]{2})\.([0-9]{4})$', oldstyleproject.expiry)
-    except:
-      m = None
-
-    if m:
-      data['Expire'] = "%s-%s-%s" % (m.group(3), m.group(2), m.group(1))
-      osproject.add_tag(connection.identity, 'Expire=%s' % data['Expire'])
-
   # If the openstack project is managed by cloudadmin, retrieve the cloudadmin
   # project from the database, and update the name/prefix.
   if('CloudAdminProject' in data):
@@ -308,22 +645,105 @@ def getOpenstackProject(connection, project_id):
     if(pre == data['name_prefix']):
       data['name'] = post 
 
-  # Retrieve the role-assignments for the project.
-  data.update(getOpenstackRoleAssignments(connection, project_id))
+  return data
 
+def getOpenstackProject(connection, project_id, facets = None, stale = False,
+    fresh = False):
+  """ Retrieves information about an openstack-project from the openstack API
+
+  The information is returned in a large dict. Which parts of the information
+  to retrieve can be selected by supplying a collection of facets (see
+  openstackfacets); by default all of them are retrieved. The metadata is
+  always retrieved:
+    meta:    The project's id, name, description, domain and tags.
+    quota:   The compute, network and volume quotas, in data['quota'].
+    usage:   The compute and volume usage, in data['usage'].
+    swift:   The swift quota and usage, in data['quota']['swift'] and
+             data['usage']['swift'].
+    members: The users and groups having roles in the project, in
+             data['users'] and data['groups'].
+
+  Each facet is cached for a short while, so that requests following each
+  other closely, like a page and the parts it loads, only retrieves it from
+  the API's once. If 'stale' is True, the facets (except the metadata, which
+  decides who have access to the project) can be served from the cache after
+  they have expired, while they are refreshed in the background; data['stale']
+  is then set to True. This should only be used by read-only views. If 'fresh'
+  is True the cache is bypassed, and everything is retrieved from the API's.
+
+  The facets (and the name of the project's domain) are retrieved
+  concurrently once the metadata is known, so that a request waits for the
+  slowest of the API's rather than for all of them in turn.
+  """
+
+  if(facets is None):
+    facets = openstackfacets
+
+  expired = []
+  def facet(name, function, *args):
+    value, isstale = getCachedProjectFacetEntry(project_id, name, function,
+        *args, stale=stale and name != 'meta', fresh=fresh)
+    if(isstale):
+      expired.append(name)
+    return value
+
+  def swift():
+    rgwid = '%s$%s' % (project_id, project_id)
+    return {'quota': getRGWUserQuota(rgwid), 'usage': getRGWUserUsage(rgwid)}
+
+  data = facet('meta', buildOpenstackProjectMeta, connection, project_id)
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    domain = executor.submit(getCachedValue, 'cloudadmin:domain:%s' %
+        data['domain_id'], lambda: connection.identity.get_domain(
+        data['domain_id']).name)
+
+    futures = {}
+    if('quota' in facets):
+      futures['quota'] = executor.submit(facet, 'quota',
+          getOpenstackProjectQuota, connection, project_id)
+    if('usage' in facets):
+      futures['usage'] = executor.submit(facet, 'usage',
+          getOpenstackProjectUsage, connection, project_id)
+    if('swift' in facets):
+      futures['swift'] = executor.submit(facet, 'swift', swift)
+    if('members' in facets):
+      futures['members'] = executor.submit(facet, 'members',
+          getOpenstackRoleAssignments, connection, project_id)
+
+  data['domain_name'] = domain.result()
+
+  if('quota' in futures):
+    data['quota'] = futures['quota'].result()
+
+  if('usage' in futures):
+    data['usage'] = futures['usage'].result()
+
+  if('swift' in futures):
+    swiftdata = futures['swift'].result()
+    data.setdefault('quota', {})['swift'] = swiftdata['quota']
+    data.setdefault('usage', {})['swift'] = swiftdata['usage']
+
+  # Add the role-assignments for the project.
+  if('members' in futures):
+    data.update(futures['members'].result())
+
+  data['stale'] = len(expired) > 0
   return data
 
-def getAndVerifyAccessToOpenstackProject(connection, project_id, user):
-  """ Retrieve an openstack-project from the openstack API, and verify that the
-  supplied user have access to the openstack project.
+def verifyAccessToOpenstackProject(connection, osproject, user):
+  """ Verify that the supplied user have access to an openstack-project.
 
-  This method adds a new data-member 'write', which is True if the calling user
-  is allowed to update the openstack project.
+  The openstack-project is supplied as a dict, as returned by either
+  getOpenstackProject or getOpenstackProjectMeta. The access is determined from
+  the projects tags, the users group-memberships and the users role-assignments
+  in the project; nothing else about the project is retrieved.
+
+  This method adds a new data-member 'write' to the dict, which is True if the
+  user is allowed to update the openstack project, and returns the dict.
+  Raises a PermissionDenied if the user have no access to the project.
   """
 
-  # Try to recieve openstack-rpoject. Raises a LookupError if the project does
-  # not exist.
-  osproject = getOpenstackProject(connection, project_id)
   osproject['write'] = False
   
   # If the requesting user is a superuser, return the project:
@@ -358,6 +778,91 @@ def getAndVerifyAccessToOpenstackProject(connection, project_id, user):
   # Otherwise, raise a permission-denied error. 
   raise PermissionDenied('No access to project')
 
+def getAndVerifyAccessToOpenstackProject(connection, project_id, user,
+    facets = None, stale = False, fresh = False):
+  """ Retrieve an openstack-project from the openstack API, and verify that the
+  supplied user have access to the openstack project.
+
+  This method adds a new data-member 'write', which is True if the calling user
+  is allowed to update the openstack project. The facets, stale and fresh are
+  passed on to getOpenstackProject.
+  """
+
+  # Try to recieve openstack-rpoject. Raises a LookupError if the project does
+  # not exist.
+  osproject = getOpenstackProject(connection, project_id, facets, stale, fresh)
+  return verifyAccessToOpenstackProject(connection, osproject, user)
+
+def getAndVerifyAccessToOpenstackProjectMeta(connection, project_id, user,
+    fresh = False):
+  """ Retrieve the metadata of an openstack-project, and verify that the
+  supplied user have access to the openstack project.
+
+  This is a lightweight alternative to getAndVerifyAccessToOpenstackProject for
+  callers which only need to know if the user is allowed to change the project,
+  as quotas, usage and role-assignments are not collected. The data-member
+  'write' is added just as for getAndVerifyAccessToOpenstackProject. Callers
+  about to change the project should set 'fresh', so that the access is
+  verified against the current metadata.
+  """
+
+  osproject = getOpenstackProjectMeta(connection, project_id, fresh)
+  return verifyAccessToOpenstackProject(connection, osproject, user)
+
+def markOpenstackProjectDeletable(connection, project_id):
+  """ Marks an openstack project for deletion
+
+  All roles in the project are revoked, its VM's are stopped and it is tagged
+  as DELETABLE. If the project is associated with a cloudadmin project, the
+  association is removed, and the project's quotas are removed from the
+  cloudadmin project's usage.
+  """
+
+  data = buildOpenstackProjectMeta(connection, project_id)
+  osproject = connection.identity.get_project(project_id)
+  roles = {}
+
+  # Remove all users from the project
+  roleAssignments = connection.list_role_assignments(
+      filters={'project': project_id})
+  for ra in roleAssignments:
+    if(ra['id'] not in roles):
+      roles[ra['id']] = connection.identity.get_role(ra['id'])
+
+    if('user' in ra):
+      user = connection.identity.get_user(ra['user'])
+      osproject.unassign_role_from_user(connection.identity, user,
+          roles[ra['id']])
+    if('group' in ra):
+      group = connection.identity.get_group(ra['group'])
+      osproject.unassign_role_from_group(connection.identity, group,
+          roles[ra['id']])
+
+  # Stop all VM's in the project
+  for server in connection.list_servers(all_projects=True,
+      filters={'project_id': project_id}):
+    connection.compute.stop_server(server['id'])
+
+  # Mark the project for deletion
+  osproject.add_tag(connection.identity, 'DELETABLE')
+  osproject.description = "DELETABLE: %s" % osproject.description
+  osproject.commit(connection.identity)
+
+  # If the openstack-project was associated with a caproject; decrease the
+  # caproject's usage according to what the project's quotas.
+  if('CloudAdminProject' in data):
+    osproject.remove_tag(connection.identity,
+        'CloudAdminProject=%d' % int(data['CloudAdminProject']))
+    caproject = Project.objects.get(pk=int(data['CloudAdminProject']))
+    quota = getOpenstackRegionQuota(connection, project_id)
+    quota['swift'] = getRGWUserQuota('%s$%s' % (project_id, project_id))
+    osuse = QuotaInformation()
+    osuse.fromDict(quota)
+    caproject.removeUsage(osuse)
+
+  invalidateProject(project_id)
+  ProjectMembership.objects.filter(project_id=project_id).delete()
+
 def updateOpenstackProject(connection, name, description, expiry,
     create = False, openstack_id = None, domain = None, 
     cpu = 0, ram_mb = 0, 
@@ -398,8 +903,16 @@ def updateOpenstackProject(connection, name, description, expiry,
       },
     }
   else:
+    # Make sure the changes are compared to the current state of the project,
+    # and not to a cached copy.
+    invalidateProject(openstack_id)
     project = getOpenstackProject(connection, openstack_id)
 
+    # Only the quotas of the connection's own region are set, so compare with
+    # them rather than with the sum of all the regions.
+    project['quota'].update(
+        project['quota']['regions'][project['quota']['region']])
+
   # Create an empty set which can contain keywords indicating that certain
   # parts are updated, and thus needs to be saved in the end.
   project['changes'] = set()
@@ -534,7 +1047,7 @@ def updateOpenstackProject(connection, name, description, expiry,
 
     try:
       connection.set_volume_quotas(osproject.id, **vquota)
-    except:
+    except openstack.exceptions.SDKException:
       raise UsageTooHighException('Volume-quota can not be set as the use ' +\
           'is higher than the new quotas')
 
@@ -550,6 +1063,7 @@ def updateOpenstackProject(connection, name, description, expiry,
     rgw.set_user_quota(rgwid, 'bucket', swift_gb * 1048576, swift_objects, True)
     rgw.set_user_quota(rgwid, 'user', swift_gb * 1048576, swift_objects, True)
 
+  invalidateProject(osproject.id)
   return getOpenstackProject(connection, osproject.id)
 
 def createOpenstackProject(**kwargs):
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
-from configparser import ConfigParser,NoOptionError
+from configparser import ConfigParser,NoOptionError,NoSectionError
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -51,6 +51,8 @@ INSTALLED_APPS = (
 AUTHENTICATION_BACKENDS = ("django_python3_ldap.auth.LDAPBackend",)
 
 MIDDLEWARE_CLASSES = (
+    'cloudadmin.middleware.MetricsMiddleware',
+    'cloudadmin.middleware.BackendUnavailableMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
 #    'django.middleware.csrf.CsrfViewMiddleware',
@@ -115,6 +117,58 @@ else:
   DATABASES['default']['ENGINE'] = 'django.db.backends.sqlite3'                  
   DATABASES['default']['NAME'] = name
 
+# Keep the database-connections open between requests, for the number of
+# seconds set in 'conn_max_age' (0 closes them after each request). The
+# connections are checked before they are reused, unless 'health_checks' is
+# set to false (see cloudadmin.middleware).
+try:
+  DATABASES['default']['CONN_MAX_AGE'] = parser.getint('database',
+      'conn_max_age')
+except (NoOptionError, ValueError):
+  DATABASES['default']['CONN_MAX_AGE'] = 60 if dbtype == 'mysql' else 0
+
+try:
+  DATABASE_HEALTH_CHECKS = parser.getboolean('database', 'health_checks')
+except (NoOptionError, ValueError):
+  DATABASE_HEALTH_CHECKS = True
+
+# Cache
+# The cache is shared between all the worker-processes (and hosts) when using
+# memcached or redis. Other backends are local to each process or host, and
+# are mostly useful for development and testing.
+cachebackends = {
+  'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+  'pylibmc':   'django.core.cache.backends.memcached.PyLibMCCache',
+  'redis':     'django_redis.cache.RedisCache',
+  'file':      'django.core.cache.backends.filebased.FileBasedCache',
+  'locmem':    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+try:
+  cachetype = parser.get('cache', 'backend')
+except (NoSectionError, NoOptionError):
+  cachetype = 'locmem'
+
+if(cachetype not in cachebackends):
+  raise ValueError('The cache-backend must be one of %s' %
+      ', '.join(sorted(cachebackends)))
+
+CACHES = {
+  'default': {
+    'BACKEND': cachebackends[cachetype],
+    'KEY_PREFIX': 'cloudadmin',
+  }
+}
+
+try:
+  CACHES['default']['LOCATION'] = parser.get('cache', 'location')
+except (NoSectionError, NoOptionError):
+  if(cachetype == 'file'):
+    CACHES['default']['LOCATION'] = os.path.join(BASE_DIR, 'cache')
+
+# Sessions are stored in the database, and cached.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -133,6 +187,13 @@ except NoOptionError:
   STATIV_ROOT = None
 LOGIN_URL = '/web/login/'
 
+# E-mail is used to notify project-administrators about expiring projects.
+try:
+  EMAIL_HOST = parser.get('mail', 'host')
+  DEFAULT_FROM_EMAIL = parser.get('mail', 'from')
+except (NoSectionError, NoOptionError):
+  EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
 # The URL of the LDAP server.
 LDAP_AUTH_URL = parser.get('LDAP', 'url') 
 
@@ -203,3 +264,11 @@ LDAP_AUTH_ACTIVE_DIRECTORY_DOMAIN = parser.get('LDAP', 'domain')
 # the `ldap_sync_users` command will perform an anonymous query.
 LDAP_AUTH_CONNECTION_USERNAME = None
 LDAP_AUTH_CONNECTION_PASSWORD = None
+
+# The number of seconds to wait for the LDAP server, both when connecting and
+# when waiting for answers, before giving up.
+try:
+  LDAP_AUTH_CONNECT_TIMEOUT = parser.getint('LDAP', 'timeout')
+except (NoOptionError, ValueError):
+  LDAP_AUTH_CONNECT_TIMEOUT = 10
+LDAP_AUTH_RECEIVE_TIMEOUT = LDAP_AUTH_CONNECT_TIMEOUT
@@ -103,11 +103,46 @@ function createProjectInfo(url, data) {
   return prosjekt;
 }
 
+function addGroupOption(group, selected) {
+  var select = $('select#projectGroups');
+  if(select.find('option[value=' + group['id'] + ']').length == 0) {
+    select.append($('<option>', {value: group['id'], text: group['name']}));
+  }
+  if(selected) {
+    select.find('option[value=' + group['id'] + ']').prop('selected', true);
+  }
+}
+
+function enableGroupSearch(url) {
+  var timer = null;
+
+  $('input#groupSearch').on('input', function() {
+    var search = $(this).val();
+    clearTimeout(timer);
+
+    // Wait until the user stops typing before searching.
+    timer = setTimeout(function() {
+      $.ajax({
+        url: url,
+        data: {q: search, limit: 20},
+        success: function(result) {
+          // Keep the selected groups, and replace the rest with the results.
+          $('select#projectGroups').find('option:not(:selected)').remove();
+          for(var index in result['groups']) {
+            addGroupOption(result['groups'][index], false);
+          }
+        },
+      });
+    }, 250);
+  });
+}
+
 function prepareCreateProjectModal(url) {
   if(url === undefined)
     url = 0;
 
-  $('select#projectGroups').find('option').prop('selected', false)
+  $('select#projectGroups').empty();
+  $('input#groupSearch').val('');
   if(url == 0) {
     $('form#newProjectForm').find("input[type=text], textarea").val("");
     $('form#newProjectForm').find("input[name=id]").val("0");
@@ -138,9 +173,7 @@ function prepareCreateProjectModal(url) {
             ']').prop('selected', true)
 
         for(var id in data['groups']) {
-          console.log(id);
-          $('select#projectGroups').find('option[value=' + data['groups'][id]['id'] + 
-              ']').prop('selected', true)
+          addGroupOption(data['groups'][id], true);
         }
 
 
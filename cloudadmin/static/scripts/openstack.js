@@ -84,7 +84,7 @@ function enableUpdateOSProjectButton(baseurl, id) {
 
 function loadOSQuota(baseurl, id) {
   $.ajax({
-    url: baseurl + id + '/',
+    url: baseurl + id + '/?include=meta,quota,swift',
     success: function(result) {
       // Some data is always available:
       $('#' + result['id'] + '.expiry').html(result['Expire']);
@@ -275,20 +275,22 @@ function prepareCreateOSProjectModal(baseurl, projectid) {
     $.ajax({
       url: baseurl + projectid + '/',
       success: function(result) {
+        // Only the quotas of the main region are managed by cloudadmin.
         q = result['quota'];
+        r = q['regions'][q['region']];
         $('form#newOSProjectForm').find("input[name=id]").val(result['id']);
         $('form#newOSProjectForm').find("input[name=name]").
             val(result['name']);
         $('form#newOSProjectForm').find("textarea[name=description]").
             val(result['description']);
         $('form#newOSProjectForm').find("input[name=cpu_cores]").
-            val(q['compute']['cpu']);
+            val(r['compute']['cpu']);
         $('form#newOSProjectForm').find("input[name=ram_gb]").
-            val(q['compute']['ram_mb'] / 1024);
+            val(r['compute']['ram_mb'] / 1024);
         $('form#newOSProjectForm').find("input[name=cinder_gb]").
-            val(q['volumes']['gigabytes']);
+            val(r['volumes']['gigabytes']);
         $('form#newOSProjectForm').find("input[name=cinder_volumes]").
-            val(q['volumes']['volumes']);
+            val(r['volumes']['volumes']);
         $('form#newOSProjectForm').find("input[name=expiry]").
             val(result['Expire']);
 
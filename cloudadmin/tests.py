@@ -0,0 +1,49 @@
+import os
+import re
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from cloudadmin.openstack import getOpenstackProjectUsage
+
+class OpenstackUsageTemplateTest(SimpleTestCase):
+  """ Verifies that the usage collected from openstack contains the keys the
+  project-info template reads. """
+
+  def getConnection(self):
+    connection = mock.Mock()
+    connection.get_compute_limits.return_value = {
+      'total_instances_used': 2,
+      'max_total_instances': 10,
+      'total_cores_used': 4,
+      'max_total_cores': 10,
+      'total_ram_used': 8192,
+      'max_total_ram_size': 16384,
+    }
+    connection.get_volume_quotas.return_value = {
+      'gigabytes': 100,
+      'volumes': 10,
+    }
+    connection.volume.volumes.return_value = [mock.Mock(size=20)]
+    return connection
+
+  def getTemplateKeys(self, part):
+    path = os.path.join(os.path.dirname(__file__), 'templates', 'cloudadmin',
+        'parts', 'openstackprojectinfo.html')
+    with open(path) as template:
+      return set(re.findall(r'project\.usage\.%s\.(\w+)' % part,
+          template.read()))
+
+  def test_usage_contains_template_keys(self):
+    connections = {'One': self.getConnection(), 'Two': self.getConnection()}
+    with mock.patch('cloudadmin.openstack.getOpenstackRegionConnections',
+        return_value = connections):
+      usage = getOpenstackProjectUsage(mock.Mock(), 'x')
+
+    for part in ['compute', 'volumes']:
+      for region in [usage] + list(usage['regions'].values()):
+        missing = self.getTemplateKeys(part) - set(region[part].keys())
+        self.assertEqual(missing, set(), 'Missing keys in usage[%s]' % part)
+
+    self.assertEqual(usage['compute']['ram_percent'], 50)
@@ -1,7 +1,8 @@
 from django.conf.urls import include, url
 
 from cloudadmin.views import main, parts
-from cloudadmin.endpoints import auth, group, openstack, project, quota
+from cloudadmin.endpoints import auth, group, membership, metrics, \
+    openstack, project, quota
 
 webapp = [
   url(r'^$',                  main.overview,       name='web.overview'),
@@ -22,12 +23,17 @@ api_v1_openstack = [
   url(r'^$',                  openstack.index,  name='api.v1.openstack'),
   url(r'^([0-9a-z]{32})/$',   openstack.single, name='api.v1.openstack.single'),
   url(r'^([0-9a-z]{32})/assignments$', openstack.assignments),
+  url(r'^([0-9a-z]{32})/assignments/bulk$', openstack.assignmentsbulk),
+  url(r'^([0-9a-z]{32})/usage$',       openstack.usage),
 ]
 
 api_v1 = [
   url(r'^auth/$',             auth.auth,      name='api.v1.auth'),
   url(r'^deauth/$',           auth.deauth,    name='api.v1.deauth'),
   url(r'^group/$',            group.list,     name='api.v1.group'),
+  url(r'^membership/$',       membership.index, name='api.v1.membership'),
+  url(r'^membership/offboard/$', membership.offboard,
+      name='api.v1.membership.offboard'),
   url(r'^project/$',          project.index,  name='api.v1.project'),
   url(r'^project/([0-9]+)/$', project.single),
   url(r'^openstack/project/', include(api_v1_openstack)),
@@ -36,7 +42,8 @@ api_v1 = [
 ]
 
 urlpatterns = [
-  url(r'^$',       main.index,       name='web.index'),
-  url(r'^web/',    include(webapp)),
-  url(r'^api/v1/', include(api_v1)),
+  url(r'^$',        main.index,       name='web.index'),
+  url(r'^web/',     include(webapp)),
+  url(r'^api/v1/',  include(api_v1)),
+  url(r'^metrics$', metrics.index,    name='metrics'),
 ]
@@ -0,0 +1,279 @@
+""" Utility methods to collect and analyze the usage-history of projects
+
+This module contains methods which samples the resource-usage of all openstack
+projects, stores the samples as a time-series in the database, downsamples old
+samples and estimates when a project will run out of its quotas. This lets us
+answer capacity-planning questions without querying the live API's.
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from configparser import NoOptionError, NoSectionError
+from datetime import timedelta
+
+import openstack
+
+from django.db import transaction
+from django.utils import timezone
+from rgwadmin.exceptions import NoSuchUser, RGWAdminException
+
+from cloudadmin.ceph import getRGWConnection
+from cloudadmin.exceptions import BackendUnavailableException
+from cloudadmin.models import UsageSample
+from cloudadmin.openstack import getOpenstackRegionConnections, \
+    getOpenstackWorkers, sumOpenstackQuotas
+from cloudadmin.settings import parser
+
+logger = logging.getLogger(__name__)
+
+def getRetention(resolution):
+  """ Returns for how many days samples of a certain resolution is kept
+
+  The values are read from the settings 'raw_days', 'hourly_days' and
+  'daily_days' in the usage-section of the configuration-file, and defaults to
+  2, 60 and 730 days.
+  """
+
+  defaults = {'raw': 2, 'hourly': 60, 'daily': 730}
+
+  try:
+    return parser.getint('usage', '%s_days' % resolution)
+  except (NoSectionError, NoOptionError, ValueError):
+    return defaults[resolution]
+
+def collectUsageSamples(connection):
+  """ Samples the current usage of all openstack projects.
+
+  The volumes and the RGW buckets of all projects are summed up using a single
+  listing each, while the compute-usage and the quotas are retrieved for the
+  projects concurrently. Projects marked as DELETABLE are skipped. The usage
+  and quotas are summed up over all the configured openstack regions. A
+  project whose usage could not be retrieved is logged and skipped, so that
+  the other projects are still sampled.
+
+  Returns the number of samples stored.
+  """
+
+  now = timezone.now()
+  rgw = getRGWConnection()
+  projects = [p.id for p in connection.identity.projects()
+      if 'DELETABLE' not in p.tags]
+
+  regions = list(getOpenstackRegionConnections(connection).values())
+
+  # Sum up the size and number of volumes for every project, listing the
+  # volumes of the regions concurrently.
+  volumes = {}
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    listings = list(executor.map(
+        lambda c: list(c.volume.volumes(all_projects=True)), regions))
+  for listing in listings:
+    for volume in listing:
+      usage = volumes.setdefault(volume.project_id, [0, 0])
+      usage[0] += volume.size
+      usage[1] += 1
+
+  # Sum up the size and number of objects in the buckets of every rgw-user.
+  buckets = {}
+  for bucket in rgw.get_bucket(stats=True):
+    usage = buckets.setdefault(bucket['owner'], [0, 0])
+    for gw in bucket['usage']:
+      usage[0] += bucket['usage'][gw]['size']
+      usage[1] += bucket['usage'][gw]['num_objects']
+
+  def sample(project_id):
+    rgwid = '%s$%s' % (project_id, project_id)
+    try:
+      limits = [c.get_compute_limits(project_id) for c in regions]
+      volumequotas = [c.get_volume_quotas(project_id) for c in regions]
+      try:
+        swiftquota = rgw.get_quota(rgwid, quota_type = 'user')
+      except NoSuchUser:
+        swiftquota = {'max_size': 0, 'max_objects': 0}
+    except (openstack.exceptions.SDKException, RGWAdminException,
+        BackendUnavailableException):
+      logger.exception('Could not sample the usage of project %s' %
+          project_id)
+      return None
+
+    compute = {key: sum([l[key] for l in limits]) for key in
+        ['total_instances_used', 'total_cores_used', 'total_ram_used']}
+    for key in ['max_total_cores', 'max_total_ram_size']:
+      compute[key] = sumOpenstackQuotas([l[key] for l in limits])
+    volumequota = {key: sumOpenstackQuotas([q[key] for q in volumequotas])
+        for key in ['gigabytes', 'volumes']}
+
+    volumeusage = volumes.get(project_id, [0, 0])
+    swiftusage = buckets.get(rgwid, [0, 0])
+
+    return UsageSample(
+      project_id           = project_id,
+      resolution           = UsageSample.RAW,
+      timestamp            = now,
+      instances            = compute['total_instances_used'],
+      cpu                  = compute['total_cores_used'],
+      ram_mb               = compute['total_ram_used'],
+      cinder_gb            = volumeusage[0],
+      cinder_volumes       = volumeusage[1],
+      swift_bytes          = swiftusage[0],
+      swift_objects        = swiftusage[1],
+      cpu_quota            = compute['max_total_cores'],
+      ram_mb_quota         = compute['max_total_ram_size'],
+      cinder_gb_quota      = volumequota['gigabytes'],
+      cinder_volumes_quota = volumequota['volumes'],
+      swift_bytes_quota    = swiftquota['max_size'],
+      swift_objects_quota  = swiftquota['max_objects'],
+    )
+
+  with ThreadPoolExecutor(max_workers = getOpenstackWorkers()) as executor:
+    samples = [s for s in executor.map(sample, projects) if s is not None]
+
+  UsageSample.objects.bulk_create(samples)
+  return len(samples)
+
+def truncateHour(timestamp):
+  """ Returns the start of the hour a timestamp is within """
+
+  return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def truncateDay(timestamp):
+  """ Returns the start of the day a timestamp is within """
+
+  return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# The functions determining the period a sample of a certain resolution
+# covers.
+truncations = {
+  UsageSample.HOURLY: truncateHour,
+  UsageSample.DAILY:  truncateDay,
+}
+
+def aggregateSamples(samples, target):
+  """ Groups samples into samples of a coarser resolution
+
+  The supplied samples, which must be sorted by time, are grouped by project
+  and by the period of the 'target' resolution they are within. Returns a list
+  (sorted by project and time) with a new, unsaved sample for each group,
+  storing the peak usage in the period and the last known quotas.
+  """
+
+  truncate = truncations[target]
+
+  aggregated = {}
+  for sample in samples:
+    key = (sample.project_id, truncate(sample.timestamp))
+
+    if(key not in aggregated):
+      aggregated[key] = UsageSample(project_id=sample.project_id,
+          resolution=target, timestamp=key[1])
+    new = aggregated[key]
+
+    for element in sample.getSampleElements():
+      setattr(new, element, max(getattr(new, element),
+          getattr(sample, element)))
+    for element in sample.getQuotaElements().values():
+      setattr(new, element, getattr(sample, element))
+
+  return [aggregated[key] for key in sorted(aggregated.keys())]
+
+def downsample(source, target, before):
+  """ Replaces the samples of one resolution with coarser samples
+
+  All samples of the 'source' resolution older than 'before' are replaced by
+  samples of the 'target' resolution (see aggregateSamples).
+  """
+
+  query = UsageSample.objects.filter(resolution=source, timestamp__lt=before)
+  samples = aggregateSamples(
+      query.order_by('project_id', 'timestamp').iterator(), target)
+
+  with transaction.atomic():
+    UsageSample.objects.bulk_create(samples)
+    query.delete()
+
+def downsampleUsageSamples():
+  """ Downsamples and purges samples according to the retention settings
+
+  Raw samples are downsampled to hourly samples, hourly samples are
+  downsampled to daily samples, and daily samples are eventually deleted.
+  """
+
+  now = timezone.now()
+
+  downsample(UsageSample.RAW, UsageSample.HOURLY,
+      truncateHour(now - timedelta(days=getRetention('raw'))))
+  downsample(UsageSample.HOURLY, UsageSample.DAILY,
+      truncateDay(now - timedelta(days=getRetention('hourly'))))
+
+  UsageSample.objects.filter(resolution=UsageSample.DAILY,
+      timestamp__lt=now - timedelta(days=getRetention('daily'))).delete()
+
+def getUsageHistory(project_id, resolution, since):
+  """ Returns the samples of a project with a certain resolution since a time
+
+  Samples are only downsampled once they are older than the retention of
+  their resolution, so the newest part of the history is only stored with a
+  finer resolution. Those samples are aggregated to the requested resolution
+  (without being stored), so that the history always reaches up to the latest
+  sample.
+  """
+
+  samples = UsageSample.objects.filter(project_id=project_id,
+      resolution__lte=resolution, timestamp__gte=since).order_by('timestamp')
+
+  if(resolution == UsageSample.RAW):
+    return list(samples)
+
+  return aggregateSamples(samples.iterator(), resolution)
+
+def forecastUsage(samples):
+  """ Estimates when a project will run out of each of its quotas.
+
+  A linear trend is fitted (using least squares) to each of the usage-values
+  in the supplied samples, which must be sorted by time. The returned dict
+  contains a dict for each usage-value with the following members:
+    current:   The usage in the last sample.
+    quota:     The quota in the last sample.
+    per_day:   The growth of the usage per day according to the trend, or None
+               if there is less than two samples.
+    exhausted: When the quota is estimated to be exhausted, or None if the
+               usage is not growing or the quota is unlimited.
+  """
+
+  forecast = {}
+  if not samples:
+    return forecast
+
+  latest = samples[-1]
+  days = [(s.timestamp - samples[0].timestamp).total_seconds() / 86400
+      for s in samples]
+  meandays = sum(days) / len(days)
+  variance = sum((d - meandays)**2 for d in days)
+
+  for element, quotaelement in latest.getQuotaElements().items():
+    values = [getattr(s, element) for s in samples]
+    current = getattr(latest, element)
+    quota = getattr(latest, quotaelement)
+
+    if(variance):
+      meanvalue = sum(values) / len(values)
+      slope = sum((d - meandays) * (v - meanvalue)
+          for d, v in zip(days, values)) / variance
+    else:
+      slope = None
+
+    if(slope and slope > 0 and quota > 0):
+      exhausted = latest.timestamp + \
+          timedelta(days=max(quota - current, 0) / slope)
+    else:
+      exhausted = None
+
+    forecast[element] = {
+      'current':   current,
+      'quota':     quota,
+      'per_day':   slope,
+      'exhausted': exhausted,
+    }
+
+  return forecast
@@ -1,5 +1,9 @@
 import ipaddress
 import re
+import threading
+import time
+
+from collections import OrderedDict
 
 from django.core.urlresolvers import reverse
 
@@ -120,5 +124,58 @@ def createContext(request):
 
   return context
 
+def getCNFromDN(dn):
+  """ Returns the CN of a DN, or the DN itself if it does not start with a CN
+  """
+
+  m = re.match(r'^CN=((\\.|[^,])*),', dn, re.IGNORECASE)
+  if m:
+    return m.group(1)
+  return dn
+
 def requireSuperuser(user):
     return user.is_superuser
+
+class ExpiringLRUCache(object):
+  """ A small, thread-safe, in-process LRU-cache where the entries expire.
+
+  The cache holds at most 'size' entries, and evicts the least recently used
+  entry when it is full. Entries older than 'ttl' seconds are never returned.
+  """
+
+  def __init__(self, size, ttl):
+    self.size = size
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    """ Returns the value cached for the key, or None if there is none """
+
+    with self.lock:
+      try:
+        value, stored = self.entries[key]
+      except KeyError:
+        return None
+
+      if(time.monotonic() - stored > self.ttl):
+        del self.entries[key]
+        return None
+
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value):
+    """ Stores a value in the cache """
+
+    with self.lock:
+      self.entries[key] = (value, time.monotonic())
+      self.entries.move_to_end(key)
+      while(len(self.entries) > self.size):
+        self.entries.popitem(last=False)
+
+  def delete(self, key):
+    """ Removes a key from the cache, if it is present """
+
+    with self.lock:
+      self.entries.pop(key, None)
@@ -1,7 +1,6 @@
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import user_passes_test 
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import Group
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, Http404
@@ -10,7 +9,8 @@ from django.utils.datastructures import MultiValueDictKeyError
 
 from cloudadmin.settings import parser
 from cloudadmin.utils import createContext, requireSuperuser, rolenames
-from cloudadmin.openstack import getOpenstackConnection, getOpenstackProject, getAndVerifyAccessToOpenstackProject
+from cloudadmin.openstack import getOpenstackConnection, \
+    getAndVerifyAccessToOpenstackProjectMeta
 
 @login_required
 def index(request):
@@ -36,6 +36,9 @@ def openstack(request):
 @login_required
 def openstackproject(request, projectid):
   """ A view where a user can manage access to an openstack project.
+
+  Only the project's metadata is retrieved here; the usage-information is
+  ajax-loaded from the 'web.openstack.projectinfo' view.
   """
   context = createContext(request)
 
@@ -43,7 +46,7 @@ def openstackproject(request, projectid):
   context['rolenames'] = rolenames
 
   try:
-    context['project'] = getAndVerifyAccessToOpenstackProject(connection,
+    context['project'] = getAndVerifyAccessToOpenstackProjectMeta(connection,
         projectid, request.user)
   except LookupError:
     raise Http404
@@ -58,7 +61,6 @@ def administrative(request):
   """ A view where superusers can manage cloudadmin projects """
 
   context = createContext(request)
-  context['groups'] = Group.objects.order_by('name').all()
   return render(request, 'cloudadmin/administrative.html', context) 
 
 @login_required
@@ -18,7 +18,8 @@ def openstackprojectinfo(request, projectid):
 
   try:
     context['project'] = getAndVerifyAccessToOpenstackProject(connection,
-        projectid, request.user)
+        projectid, request.user, ['meta', 'quota', 'usage', 'swift'],
+        stale=True)
   except LookupError:
     raise Http404
 